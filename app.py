@@ -1,4 +1,9 @@
+import asyncio
+import contextlib
+import functools
+import itertools
 import logging
+import os
 import re
 import time
 import typing
@@ -6,12 +11,22 @@ import warnings
 from pathlib import Path
 
 import gradio as gr
-import torch
-from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline, Pipeline
 
+from engine_swap import EngineSwapper, install_swap_signal_handler, mount_swap_route
+from exporter import mount_export_route
+from pyodide_requirements import infer_requirements, merge_requirements
+from scheduler import Priority, QueueFull, RequestScheduler
+from single_flight import SingleFlight
+from speech_to_text import load_speech_to_text_pipeline, warm_up, TranscriptionBatcher, whisper_device, whisper_int8, \
+    whisper_onnx_dir, whisper_threads, whisper_max_batch_size, whisper_max_wait
 from templates import starting_app_code, update_iframe_js, copy_snippet_js, download_code_js, load_js, DemoType, \
-    copy_share_link_js
-from text_generator import init_generator, TensorRTLLMGenerator
+    copy_share_link_js, edit_prompt, code_pattern, stream_delta, append_delta_js, js_length
+from text_generator import init_generator, StreamingGenerator
+from tracing import request_trace, span, mount_trace_route
+from vendored_assets import mount_vendored_assets
+
+if typing.TYPE_CHECKING:
+    from transformers import Pipeline
 
 # Filter the UserWarning raised by the audio component.
 warnings.filterwarnings("ignore", message='Trying to convert audio automatically from int32 to 16-bit int format')
@@ -24,8 +39,13 @@ logging.basicConfig(
 
 logger = logging.getLogger("my_logger")
 
+# Streamed text is sent to the browser at most once per interval, as the chunk added since the previous send, unless
+# that chunk grows past the size limit first.
+stream_flush_interval = float(os.getenv('KITEWIND_STREAM_FLUSH_MS', '50')) / 1000
+stream_flush_bytes = int(os.getenv('KITEWIND_STREAM_FLUSH_BYTES', '1024'))
+
 
-def init_llm() -> TensorRTLLMGenerator:
+def init_llm() -> StreamingGenerator:
     print("Initializing LLM...")
     start = time.time()
     llm = init_generator(streaming=False)
@@ -34,55 +54,176 @@ def init_llm() -> TensorRTLLMGenerator:
     return llm
 
 
-def init_speech_to_text_model() -> Pipeline:
-    device = "cuda:0" if torch.cuda.is_available() else "cpu"
-    torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
-
-    model_id = "distil-whisper/distil-medium.en"
-    model = AutoModelForSpeechSeq2Seq.from_pretrained(
-        model_id, torch_dtype=torch_dtype, use_safetensors=True
-    )
-    model.to(device)
-    processor = AutoProcessor.from_pretrained(model_id)
-    return pipeline(
-        "automatic-speech-recognition",
-        model=model,
-        tokenizer=processor.tokenizer,
-        feature_extractor=processor.feature_extractor,
-        max_new_tokens=128,
-        torch_dtype=torch_dtype,
-        device=device,
-    )
-
-
-rtx_generator = init_llm()
-whisper_pipe = init_speech_to_text_model()
-
-code_pattern = re.compile(r'```python\n(.*?)```', re.DOTALL)
+def init_speech_to_text_model() -> 'Pipeline':
+    print("Initializing speech to text model...")
+    start = time.time()
+    whisper_pipe = load_speech_to_text_pipeline(whisper_device, whisper_int8, whisper_onnx_dir, whisper_threads)
+    print(f"Speech to text model initialized on {whisper_pipe.device} in {time.time() - start:.2f} seconds; "
+          f"warm-up took {warm_up(whisper_pipe):.2f} seconds")
+    return whisper_pipe
 
 
-def generate_text(code: str, prompt: str) -> (str, str, str):
-    logger.info(f"Calling API with prompt:\n{prompt}")
-    prompt = f"```python\n{code}```\nGiven the code above return only updated code for the following request:\n{prompt}\n"
-    start_time = time.time()
-    assistant_reply = rtx_generator.generate(prompt)
-    end_time = time.time()
-    print(f'LLM GENERATED RESPONSE IN {end_time - start_time:.2f} seconds\n{assistant_reply}')
-    logger.info(f'LLM RESPONSE\n{assistant_reply}')
-    match = re.search(code_pattern, assistant_reply)
-    if not match:
-        return assistant_reply, code, None
-    new_code = match.group(1)
-    logger.info(f'NEW CODE:\nnew_code')
-    return assistant_reply, new_code, None
+engine_swapper = EngineSwapper(init_llm())
+whisper_pipe = init_speech_to_text_model()
+transcription_batcher = TranscriptionBatcher(whisper_pipe, whisper_max_batch_size, whisper_max_wait)
+
+
+# Cancel events for the generation each session has in flight per tab; a new request supersedes the previous one.
+active_generations = {}
+generation_flights = SingleFlight()
+# Tags each reply's streamed chunks so the browser can tell a new reply from the previous one.
+generation_ids = itertools.count()
+# A worker pool decodes one request per replica; the in-process generator decodes one at a time. Engine swaps resize
+# it to the new generator.
+generation_scheduler = RequestScheduler(max_concurrency=getattr(engine_swapper.generator, 'replicas', 1),
+                                        max_queue_depth=16, wait_slo=60.0)
+engine_swapper.scheduler = generation_scheduler
+
+
+async def scheduled_generation(prompt: str, session: str, priority: Priority, prompt_table_name: str):
+    async with generation_scheduler.slot(session, priority):
+        # Holding the generator marks the request in flight so a hot swap drains it before freeing the old engine.
+        with engine_swapper.acquire() as generator:
+            async for chunk in generator.agenerate(prompt, prompt_table_name=prompt_table_name):
+                yield chunk
+
+
+async def until_cancelled(chunks: typing.AsyncIterator, cancel_event: asyncio.Event) -> typing.AsyncIterator:
+    """Yields from chunks until cancel_event is set, including while waiting for the next chunk, e.g. in the queue."""
+    chunks = aiter(chunks)
+    cancelled = asyncio.ensure_future(cancel_event.wait())
+    try:
+        while not cancel_event.is_set():
+            next_chunk = asyncio.ensure_future(anext(chunks))
+            await asyncio.wait([next_chunk, cancelled], return_when=asyncio.FIRST_COMPLETED)
+            if not next_chunk.done():
+                # Leaving the queue or stopping the generation happens as the source unwinds.
+                next_chunk.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await next_chunk
+                return
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        cancelled.cancel()
+        await chunks.aclose()
+
+
+async def generate_text(code: str, prompt: str, request: gr.Request, demo_type: DemoType = DemoType.GRADIO,
+                        priority: Priority = Priority.TYPED):
+    with request_trace('generate_text', session=request.session_hash, priority=priority.name):
+        logger.info(f"Calling API with prompt:\n{prompt}")
+        with span('prompt_build'):
+            prompt = edit_prompt(code, prompt)
+        # Engines built with prompt tuning use the soft prompt table named after the demo type, if one is registered.
+        prompt_table_name = demo_type.name.lower()
+        request_key = engine_swapper.generator.request_key(prompt, prompt_table_name)
+        # Requests that join an identical in-flight generation add no load so they skip admission control.
+        if request_key not in generation_flights.flights:
+            try:
+                estimated_wait = generation_scheduler.admit(request.session_hash, priority)
+            except QueueFull as e:
+                raise gr.Error(str(e))
+            if estimated_wait >= 1:
+                gr.Info(f"Request queued; estimated wait is about {estimated_wait:.0f} seconds.")
+        cancel_event = asyncio.Event()
+        # Both tabs share the session hash; a request only supersedes the previous one from its own tab.
+        generation_key = (request.session_hash, demo_type)
+        previous_cancel_event = active_generations.get(generation_key)
+        if previous_cancel_event is not None:
+            previous_cancel_event.set()
+        active_generations[generation_key] = cancel_event
+        start_time = time.time()
+        assistant_reply = ''
+        unsent = ''
+        streamed = ''
+        sent_length = 0
+        generation_id = next(generation_ids)
+        last_flush = None
+        try:
+            with span('generate'):
+                # Identical concurrent requests (double submits, a shared link opened at once) attach to one generation.
+                chunks = generation_flights.subscribe(
+                    request_key, lambda: scheduled_generation(prompt, request.session_hash, priority, prompt_table_name))
+                async for chunk in until_cancelled(chunks, cancel_event):
+                    # Only the final decode is kept: streamed deltas hold back text that may still be rewritten.
+                    assistant_reply = chunk.reply if chunk.reply is not None else assistant_reply + chunk.delta
+                    unsent += chunk.delta
+                    now = time.monotonic()
+                    if last_flush is not None and now - last_flush < stream_flush_interval and \
+                            len(unsent.encode()) < stream_flush_bytes:
+                        continue
+                    last_flush = now
+                    # The chat and code components keep their values; the delta component's js appends the chunk.
+                    yield gr.update(), gr.update(), stream_delta(generation_id, sent_length, unsent)
+                    sent_length += js_length(unsent)
+                    streamed += unsent
+                    unsent = ''
+        finally:
+            if active_generations.get(generation_key) is cancel_event:
+                del active_generations[generation_key]
+        # The textarea ignores a final value equal to its previous reply (e.g. the same question asked again), so the
+        # text still held back is sent as a delta too, or the whole reply if the final decode rewrote streamed text.
+        if not assistant_reply.startswith(streamed):
+            yield gr.update(), gr.update(), stream_delta(generation_id, 0, assistant_reply)
+        elif len(assistant_reply) > len(streamed):
+            yield gr.update(), gr.update(), stream_delta(generation_id, sent_length, assistant_reply[len(streamed):])
+        end_time = time.time()
+        if cancel_event.is_set():
+            print(f'LLM GENERATION CANCELLED AFTER {end_time - start_time:.2f} seconds')
+            # Leave the components consistent with the text streamed so far; the code is unchanged.
+            yield assistant_reply, code, gr.update()
+            return
+        print(f'LLM GENERATED RESPONSE IN {end_time - start_time:.2f} seconds\n{assistant_reply}')
+        logger.info(f'LLM RESPONSE\n{assistant_reply}')
+        with span('regex_extraction'):
+            match = re.search(code_pattern, assistant_reply)
+        # The full reply resyncs the chat component's value with the text appended in the browser.
+        if not match:
+            yield assistant_reply, code, gr.update()
+            return
+        new_code = match.group(1)
+        logger.info(f'NEW CODE:\nnew_code')
+        yield assistant_reply, new_code, gr.update()
+
+
+# Gradio injects gr.Request by the handler's type hints, which functools.partial hides, so each tab gets wrappers.
+async def generate_gradio_text(code: str, prompt: str, request: gr.Request):
+    async for outputs in generate_text(code, prompt, request, DemoType.GRADIO):
+        yield outputs
+
+
+async def generate_stlite_text(code: str, prompt: str, request: gr.Request):
+    async for outputs in generate_text(code, prompt, request, DemoType.STREAMLIT):
+        yield outputs
+
+
+async def generate_gradio_voice_text(code: str, prompt: str, request: gr.Request):
+    async for outputs in generate_text(code, prompt, request, DemoType.GRADIO, Priority.VOICE):
+        yield outputs
+
+
+async def generate_stlite_voice_text(code: str, prompt: str, request: gr.Request):
+    async for outputs in generate_text(code, prompt, request, DemoType.STREAMLIT, Priority.VOICE):
+        yield outputs
 
 
 def transcribe(audio: str) -> (str, str):
-    start = time.time()
-    result = whisper_pipe(audio)
-    end = time.time()
-    print(f"TRANSCRIBED AUDIO IN {end - start:.2f} seconds")
-    return result["text"], None
+    with request_trace('transcribe'):
+        start = time.time()
+        sampling_rate = whisper_pipe.feature_extractor.sampling_rate
+        with span('audio_decode'):
+            from transformers.pipelines.audio_utils import ffmpeg_read
+            # Decode up front (as the pipeline would for a file path) so decode and inference are traced separately.
+            audio_array = ffmpeg_read(Path(audio).read_bytes(), sampling_rate)
+        with span('whisper'):
+            text = transcription_batcher.transcribe(audio_array)
+        end = time.time()
+        print(f"TRANSCRIBED AUDIO IN {end - start:.2f} seconds")
+        return text, None
 
 
 def link_copy_notify(code: str, requirements: str):
@@ -90,6 +231,8 @@ def link_copy_notify(code: str, requirements: str):
 
 
 def copy_notify(code: str, requirements: str):
+    if code is None:
+        return
     gr.Info("App code snippet copied!")
 
 
@@ -113,14 +256,18 @@ def apply_query_params(request: gr.Request) -> ([str], str, [str], str, typing.A
         selected=0)
 
 
-def update_state(code: str, requirements: [str], error: str, history: [str], current_index: int) -> (
-        str, str, [str], int):
-    # Only modify undo history if new code was added.
-    if history[current_index] != code:
-        history = history[:current_index + 1]
-        history.append(code)
-        current_index = len(history) - 1
-    return '\n'.join(sorted(requirements)), error, history, current_index
+def update_state(demo_type: DemoType, code: str, requirements: str, inferred: [str], history: [str],
+                 current_index: int) -> (str, [str], [str], int):
+    with request_trace('update_state', demo_type=demo_type.name):
+        # Only modify undo history if new code was added.
+        if history[current_index] != code:
+            history = history[:current_index + 1]
+            history.append(code)
+            current_index = len(history) - 1
+        # Resolve the pyodide packages for the code's imports up front so the app installs and runs once.
+        with span('infer_requirements'):
+            requirements, inferred = merge_requirements(requirements, inferred, infer_requirements(code, demo_type))
+        return '\n'.join(requirements), inferred, history, current_index
 
 
 def undo(code: str, history: [str], current_index: int) -> (str, int):
@@ -157,7 +304,8 @@ with gr.Blocks(title="KiteWind") as demo:
                             type='filepath', elem_classes=["record-btn"])
                         gradio_prompt = gr.Textbox(label="Or type a text request and press Enter",
                                                    placeholder="Need an idea? Try one of these:\n- Add a button to reverse the name\n- Change the greeting to Spanish\n- Put the reversed name output into a separate textbox")
-                    gradio_bot_text = gr.TextArea(label="🤖 Chat Assistant Response")
+                    gradio_bot_text = gr.TextArea(label="🤖 Chat Assistant Response", elem_id="gradio_bot_text")
+                    gradio_bot_text_delta = gr.Textbox(visible=False)
                     gradio_clear = gr.ClearButton([gradio_prompt, gradio_audio, gradio_bot_text])
                 with gr.Column():
                     gradio_code_area = gr.Code(
@@ -172,25 +320,45 @@ with gr.Blocks(title="KiteWind") as demo:
                         gradio_redo_btn = gr.Button("Redo")
                     gradio_error = gr.State()
                     gradio_history = gr.State(value=[])
+                    # Packages update_state added to the requirements box, as opposed to ones the user typed.
+                    gradio_inferred = gr.State(value=[])
                     gradio_index = gr.State(value=0)
-                    gradio_code_update_params = {'fn': update_state,
-                                                 'inputs': [gradio_code_area, gradio_requirements_area, gradio_error,
+                    gradio_code_update_params = {'fn': functools.partial(update_state, DemoType.GRADIO),
+                                                 'inputs': [gradio_code_area, gradio_requirements_area, gradio_inferred,
                                                             gradio_history, gradio_index],
-                                                 'outputs': [gradio_requirements_area, gradio_error, gradio_history,
-                                                             gradio_index],
-                                                 'js': update_iframe_js(DemoType.GRADIO)}
-                    gradio_gen_text_params = {'fn': generate_text, 'inputs': [gradio_code_area, gradio_prompt],
-                                              'outputs': [gradio_bot_text, gradio_code_area]}
+                                                 'outputs': [gradio_requirements_area, gradio_inferred, gradio_history,
+                                                             gradio_index]}
+                    gradio_iframe_update_params = {'fn': None, 'inputs': [gradio_code_area, gradio_requirements_area],
+                                                   'outputs': [gradio_requirements_area, gradio_error],
+                                                   'js': update_iframe_js(DemoType.GRADIO)}
+                    # Generation requests are queued by generation_scheduler rather than Gradio's FIFO queue.
+                    gradio_gen_text_params = {'fn': generate_gradio_text,
+                                              'inputs': [gradio_code_area, gradio_prompt],
+                                              'outputs': [gradio_bot_text, gradio_code_area, gradio_bot_text_delta],
+                                              'concurrency_limit': None}
+                    gradio_voice_gen_text_params = {**gradio_gen_text_params,
+                                                    'fn': generate_gradio_voice_text}
+                    # Concurrent clips from both tabs are batched by transcription_batcher.
                     gradio_transcribe_params = {'fn': transcribe, 'inputs': [gradio_audio],
-                                                'outputs': [gradio_prompt, gradio_audio]}
-                    gradio_update_btn.click(**gradio_code_update_params)
+                                                'outputs': [gradio_prompt, gradio_audio],
+                                                'concurrency_limit': whisper_max_batch_size,
+                                                'concurrency_id': 'transcribe'}
+                    gradio_update_btn.click(**gradio_code_update_params).then(**gradio_iframe_update_params)
                     gradio_undo_btn.click(undo, [gradio_code_area, gradio_history, gradio_index],
-                                          [gradio_code_area, gradio_index]).then(**gradio_code_update_params)
+                                          [gradio_code_area, gradio_index]).then(**gradio_code_update_params).then(
+                        **gradio_iframe_update_params)
                     gradio_redo_btn.click(redo, [gradio_code_area, gradio_history, gradio_index],
-                                          [gradio_code_area, gradio_index]).then(**gradio_code_update_params)
-                    gradio_prompt.submit(**gradio_gen_text_params).then(**gradio_code_update_params)
-                    gradio_audio.stop_recording(**gradio_transcribe_params).then(**gradio_gen_text_params).then(
-                        **gradio_code_update_params)
+                                          [gradio_code_area, gradio_index]).then(**gradio_code_update_params).then(
+                        **gradio_iframe_update_params)
+                    gradio_text_event = gradio_prompt.submit(**gradio_gen_text_params)
+                    gradio_text_event.then(**gradio_code_update_params).then(**gradio_iframe_update_params)
+                    gradio_voice_event = gradio_audio.stop_recording(**gradio_transcribe_params).then(
+                        **gradio_voice_gen_text_params)
+                    gradio_voice_event.then(**gradio_code_update_params).then(**gradio_iframe_update_params)
+                    # Clearing abandons the request; cancelling frees the engine after the current decode step.
+                    gradio_clear.click(None, None, None, cancels=[gradio_text_event, gradio_voice_event])
+                    gradio_bot_text_delta.change(None, [gradio_bot_text_delta], None,
+                                              js=append_delta_js("gradio_bot_text"))
             with gr.Row():
                 with gr.Column():
                     gr.Markdown("## 3. Export your app to share!")
@@ -223,7 +391,8 @@ with gr.Blocks(title="KiteWind") as demo:
                             type='filepath', elem_classes=["record-btn"])
                         stlite_prompt = gr.Textbox(label="Or type a text request and press Enter",
                                                    placeholder="Need an idea? Try one of these:\n- Add a button to reverse the name\n- Change the greeting to Spanish\n- Change the theme to soft")
-                    stlite_bot_text = gr.TextArea(label="🤖 Chat Assistant Response")
+                    stlite_bot_text = gr.TextArea(label="🤖 Chat Assistant Response", elem_id="stlite_bot_text")
+                    stlite_bot_text_delta = gr.Textbox(visible=False)
                     stlite_clear_btn = gr.ClearButton([stlite_prompt, stlite_audio, stlite_bot_text])
                 with gr.Column():
                     stlite_code_area = gr.Code(
@@ -238,25 +407,45 @@ with gr.Blocks(title="KiteWind") as demo:
                         stlite_redo_btn = gr.Button("Redo")
                     stlite_error = gr.State()
                     stlite_history = gr.State(value=[])
+                    # Packages update_state added to the requirements box, as opposed to ones the user typed.
+                    stlite_inferred = gr.State(value=[])
                     stlite_index = gr.State(value=0)
-                    stlite_code_update_params = {'fn': update_state,
-                                                 'inputs': [stlite_code_area, stlite_requirements_area, stlite_error,
+                    stlite_code_update_params = {'fn': functools.partial(update_state, DemoType.STREAMLIT),
+                                                 'inputs': [stlite_code_area, stlite_requirements_area, stlite_inferred,
                                                             stlite_history, stlite_index],
-                                                 'outputs': [stlite_requirements_area, stlite_error, stlite_history,
-                                                             stlite_index],
-                                                 'js': update_iframe_js(DemoType.STREAMLIT)}
-                    stlite_gen_text_params = {'fn': generate_text, 'inputs': [stlite_code_area, stlite_prompt],
-                                              'outputs': [stlite_bot_text, stlite_code_area]}
+                                                 'outputs': [stlite_requirements_area, stlite_inferred, stlite_history,
+                                                             stlite_index]}
+                    stlite_iframe_update_params = {'fn': None, 'inputs': [stlite_code_area, stlite_requirements_area],
+                                                   'outputs': [stlite_requirements_area, stlite_error],
+                                                   'js': update_iframe_js(DemoType.STREAMLIT)}
+                    # Generation requests are queued by generation_scheduler rather than Gradio's FIFO queue.
+                    stlite_gen_text_params = {'fn': generate_stlite_text,
+                                              'inputs': [stlite_code_area, stlite_prompt],
+                                              'outputs': [stlite_bot_text, stlite_code_area, stlite_bot_text_delta],
+                                              'concurrency_limit': None}
+                    stlite_voice_gen_text_params = {**stlite_gen_text_params,
+                                                    'fn': generate_stlite_voice_text}
+                    # Concurrent clips from both tabs are batched by transcription_batcher.
                     stlite_transcribe_params = {'fn': transcribe, 'inputs': [stlite_audio],
-                                                'outputs': [stlite_prompt, stlite_audio]}
-                    stlite_update_btn.click(**stlite_code_update_params)
+                                                'outputs': [stlite_prompt, stlite_audio],
+                                                'concurrency_limit': whisper_max_batch_size,
+                                                'concurrency_id': 'transcribe'}
+                    stlite_update_btn.click(**stlite_code_update_params).then(**stlite_iframe_update_params)
                     stlite_undo_btn.click(undo, [stlite_code_area, stlite_history, stlite_index],
-                                          [stlite_code_area, stlite_index]).then(**stlite_code_update_params)
+                                          [stlite_code_area, stlite_index]).then(**stlite_code_update_params).then(
+                        **stlite_iframe_update_params)
                     stlite_redo_btn.click(redo, [stlite_code_area, stlite_history, stlite_index],
-                                          [stlite_code_area, stlite_index]).then(**stlite_code_update_params)
-                    stlite_prompt.submit(**stlite_gen_text_params).then(**stlite_code_update_params)
-                    stlite_audio.stop_recording(**stlite_transcribe_params).then(**stlite_gen_text_params).then(
-                        **stlite_code_update_params)
+                                          [stlite_code_area, stlite_index]).then(**stlite_code_update_params).then(
+                        **stlite_iframe_update_params)
+                    stlite_text_event = stlite_prompt.submit(**stlite_gen_text_params)
+                    stlite_text_event.then(**stlite_code_update_params).then(**stlite_iframe_update_params)
+                    stlite_voice_event = stlite_audio.stop_recording(**stlite_transcribe_params).then(
+                        **stlite_voice_gen_text_params)
+                    stlite_voice_event.then(**stlite_code_update_params).then(**stlite_iframe_update_params)
+                    # Clearing abandons the request; cancelling frees the engine after the current decode step.
+                    stlite_clear_btn.click(None, None, None, cancels=[stlite_text_event, stlite_voice_event])
+                    stlite_bot_text_delta.change(None, [stlite_bot_text_delta], None,
+                                              js=append_delta_js("stlite_bot_text"))
             with gr.Row():
                 with gr.Column():
                     gr.Markdown("## 3. Export your app to share!")
@@ -287,4 +476,10 @@ with gr.Blocks(title="KiteWind") as demo:
     demo.css = "footer {visibility: hidden}"
 
 if __name__ == "__main__":
-    demo.queue().launch(favicon_path='favicon-96x96.png', show_api=False, inbrowser=True)
+    demo.queue().launch(favicon_path='favicon-96x96.png', show_api=False, inbrowser=True, prevent_thread_lock=True)
+    mount_vendored_assets(demo.app)
+    mount_export_route(demo.app)
+    mount_trace_route(demo.app)
+    mount_swap_route(demo.app, engine_swapper)
+    install_swap_signal_handler(engine_swapper)
+    demo.block_thread()
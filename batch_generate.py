@@ -0,0 +1,196 @@
+import argparse
+import collections
+import csv
+import itertools
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from text_generator import EOS_TOKEN, build_generator, encode_prompt, read_engine_limits
+
+Record = collections.namedtuple('Record', 'index id input_tokens')
+
+
+def read_jsonl(path: Path, tokenizer, input_tokens_limit: int = None):
+    """Yields one record per line of {"prompt": ..., "id": ...} objects; the prompt is wrapped like the app's."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for index, line in enumerate(row for row in f if row.strip()):
+            item = json.loads(line)
+            input_tokens = encode_prompt(tokenizer, item['prompt'], input_tokens_limit)
+            yield Record(index, item.get('id', index), np.array(input_tokens, dtype=np.int32))
+
+
+def read_npy(path: Path, input_tokens_limit: int = None):
+    # Memory-mapped so only the rows being batched are read; rows are padded with the end id.
+    inputs = np.load(path, mmap_mode='r')
+    for index, row in enumerate(inputs):
+        row = np.asarray(row[row != EOS_TOKEN], dtype=np.int32)
+        yield Record(index, index, row[-input_tokens_limit:] if input_tokens_limit else row)
+
+
+def read_csv(path: Path, input_tokens_limit: int = None):
+    with open(path, 'r', newline='') as f:
+        for index, line in enumerate(row for row in csv.reader(f, delimiter=',') if row):
+            row = np.array(line, dtype=np.int32)
+            yield Record(index, index, row[-input_tokens_limit:] if input_tokens_limit else row)
+
+
+def count_records(path: Path) -> int:
+    if path.suffix == '.npy':
+        return np.load(path, mmap_mode='r').shape[0]
+    with open(path, 'r', encoding='utf-8') as f:
+        return sum(1 for line in f if line.strip())
+
+
+def read_records(path: Path, tokenizer, input_tokens_limit: int = None):
+    if path.suffix == '.jsonl':
+        return read_jsonl(path, tokenizer, input_tokens_limit)
+    if path.suffix == '.npy':
+        return read_npy(path, input_tokens_limit)
+    if path.suffix == '.csv':
+        return read_csv(path, input_tokens_limit)
+    raise ValueError(f'{path.suffix} inputs are not supported; use .jsonl, .npy or .csv')
+
+
+def bucketed(records, batch_size: int, window_size: int):
+    """Groups records of similar length into batches to minimize padding.
+
+    Only window_size records are held at a time, so the whole corpus never has to fit in memory; larger windows give
+    tighter buckets.
+    """
+    records = iter(records)
+    while True:
+        window = list(itertools.islice(records, window_size))
+        if not window:
+            return
+        window.sort(key=lambda record: len(record.input_tokens))
+        for start in range(0, len(window), batch_size):
+            yield window[start:start + batch_size]
+
+
+class JsonlWriter:
+    """Appends one line per finished record, flushed after each batch so an interrupted run can resume."""
+
+    def __init__(self, path: Path, tokenizer, resume: bool):
+        self.path = path
+        self.tokenizer = tokenizer
+        self.completed = set()
+        if resume and path.exists():
+            self.completed = self.recover()
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def recover(self) -> set:
+        completed = set()
+        valid_size = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                completed.add(json.loads(line)['index'])
+                valid_size += len(line)
+        # Drop a line that was cut off when the previous run stopped.
+        os.truncate(self.path, valid_size)
+        return completed
+
+    def write(self, batch: [Record], outputs: [np.ndarray]):
+        for record, output_tokens in zip(batch, outputs):
+            self.file.write(json.dumps({
+                'index': record.index,
+                'id': record.id,
+                'output': self.tokenizer.decode(output_tokens.tolist()),
+                'output_tokens': len(output_tokens),
+            }) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class NpyWriter:
+    """Writes output token ids into a memory-mapped [num_records, max_output_len] array padded with the end id.
+
+    Finished record indices are appended to a .progress file after their rows are flushed, which is what resume reads.
+    """
+
+    def __init__(self, path: Path, num_records: int, max_output_len: int, resume: bool):
+        self.progress_path = path.with_name(path.name + '.progress')
+        self.completed = set()
+        if resume and path.exists():
+            self.outputs = np.lib.format.open_memmap(path, mode='r+')
+            if self.progress_path.exists():
+                self.completed = {int(line) for line in self.progress_path.read_text().split()}
+        else:
+            self.outputs = np.lib.format.open_memmap(path, mode='w+', dtype=np.int32,
+                                                     shape=(num_records, max_output_len))
+            self.outputs[:] = EOS_TOKEN
+            self.progress_path.write_text('')
+        self.progress = open(self.progress_path, 'a')
+
+    def write(self, batch: [Record], outputs: [np.ndarray]):
+        for record, output_tokens in zip(batch, outputs):
+            self.outputs[record.index, :len(output_tokens)] = output_tokens
+            self.outputs[record.index, len(output_tokens):] = EOS_TOKEN
+        self.outputs.flush()
+        self.progress.write(''.join(f'{record.index}\n' for record in batch))
+        self.progress.flush()
+
+    def close(self):
+        self.outputs.flush()
+        self.progress.close()
+
+
+def run(generator, records, writer, batch_size: int, window_size: int):
+    pending = (record for record in records if record.index not in writer.completed)
+    if writer.completed:
+        print(f'Resuming; skipping {len(writer.completed)} finished records')
+    start = time.time()
+    finished = 0
+    generated_tokens = 0
+    for batch in bucketed(pending, batch_size, window_size):
+        outputs = generator.generate_batch([record.input_tokens for record in batch])
+        writer.write(batch, outputs)
+        finished += len(batch)
+        generated_tokens += sum(len(output_tokens) for output_tokens in outputs)
+        elapsed = time.time() - start
+        print(f'{finished} records, {generated_tokens / elapsed:.1f} generated tokens/s')
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Generate replies for a corpus of prompts in length-bucketed batches.')
+    parser.add_argument('--input', type=Path, required=True,
+                        help='.jsonl of {"prompt", "id"} objects, or .npy/.csv of token ids')
+    parser.add_argument('--output', type=Path, required=True,
+                        help='.jsonl of decoded replies or .npy of output token ids, written as batches finish')
+    parser.add_argument('--resume', action='store_true', help='Skip records already in the output')
+    parser.add_argument('--engine_dir', type=str, default=r'.\engines\Mistral-7B-Instruct-v0.2')
+    parser.add_argument('--tokenizer_dir', type=str, default=r'.\tokenizers\Mistral-7B-Instruct-v0.2')
+    parser.add_argument('--max_output_len', type=int, default=512)
+    parser.add_argument('--input_tokens_limit', type=int, default=None)
+    parser.add_argument('--num_beams', type=int, default=1)
+    parser.add_argument('--batch_size', type=int, default=None, help="Defaults to the engine's max_batch_size")
+    parser.add_argument('--bucket_window', type=int, default=1024,
+                        help='Number of records read ahead and sorted by length at a time')
+    parser.add_argument('--log_level', type=str, default='error')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    generator = build_generator(max_output_len=args.max_output_len, log_level=args.log_level,
+                                engine_dir=args.engine_dir, tokenizer_dir=args.tokenizer_dir,
+                                num_beams=args.num_beams, input_tokens_limit=args.input_tokens_limit)
+    batch_size = args.batch_size or read_engine_limits(Path(args.engine_dir) / 'config.json')['max_batch_size'] or 1
+    records = read_records(args.input, generator.tokenizer, args.input_tokens_limit)
+    if args.output.suffix == '.jsonl':
+        writer = JsonlWriter(args.output, generator.tokenizer, args.resume)
+    elif args.output.suffix == '.npy':
+        writer = NpyWriter(args.output, count_records(args.input), args.max_output_len, args.resume)
+    else:
+        raise SystemExit(f'{args.output.suffix} outputs are not supported; use .jsonl or .npy')
+    try:
+        run(generator, records, writer, batch_size, args.bucket_window)
+    finally:
+        writer.close()
@@ -0,0 +1,155 @@
+"""Runs a corpus of edit requests across a grid of generation settings and charts latency against success rate.
+
+A reply succeeds when code_pattern extracts code from it, the code compiles and every expected identifier appears in
+it. Settings that need a rebuilt generator (num_beams, max_output_len, input_tokens_limit) are loaded once each;
+prompt wordings are swept within each. Run from the repository root, e.g.
+`python benchmarks/generation_sweep.py --num_beams 1 --max_output_len 256,512,1024 --output_dir sweep`.
+"""
+import argparse
+import csv
+import itertools
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from templates import DemoType, code_pattern, edit_prompt, edit_prompt_template, starting_app_code  # noqa: E402
+
+prompt_templates = {
+    'default': edit_prompt_template,
+    'terse': "```python\n{code}```\n{prompt}. Reply with the full updated code in a single python code block.\n",
+    'request_first': "{prompt}\nUpdate this code and return only the full updated code in a python code block:\n"
+                     "```python\n{code}```\n",
+}
+
+
+def score(reply: str, expected_identifiers: [str]) -> dict:
+    match = code_pattern.search(reply)
+    code = match.group(1) if match else ''
+    try:
+        compile(code, '<app>', 'exec')
+        compiles = bool(match)
+    except SyntaxError:
+        compiles = False
+    identifiers = all(identifier in code for identifier in expected_identifiers)
+    return {'extracted': bool(match), 'compiles': compiles, 'identifiers': identifiers,
+            'success': bool(match) and compiles and identifiers}
+
+
+def int_list(value: str) -> [int]:
+    return [None if x == 'none' else int(x) for x in value.split(',')]
+
+
+def summarize(results: [dict]) -> [dict]:
+    summaries = []
+    key = lambda r: (r['num_beams'], r['max_output_len'], str(r['input_tokens_limit']), r['prompt_template'])
+    for setting, runs in itertools.groupby(sorted(results, key=key), key=key):
+        runs = list(runs)
+        latencies = [r['latency'] for r in runs]
+        summaries.append({
+            'num_beams': setting[0], 'max_output_len': setting[1], 'input_tokens_limit': setting[2],
+            'prompt_template': setting[3], 'runs': len(runs),
+            'mean_latency': statistics.mean(latencies), 'p50_latency': statistics.median(latencies),
+            'success_rate': sum(r['success'] for r in runs) / len(runs),
+            'compile_rate': sum(r['compiles'] for r in runs) / len(runs),
+        })
+    return summaries
+
+
+def plot(summaries: [dict], path: Path):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(9, 6))
+    for template in prompt_templates:
+        points = [s for s in summaries if s['prompt_template'] == template]
+        if not points:
+            continue
+        ax.scatter([s['mean_latency'] for s in points], [s['success_rate'] for s in points], label=template)
+        for s in points:
+            ax.annotate(f"b{s['num_beams']} o{s['max_output_len']} i{s['input_tokens_limit']}",
+                        (s['mean_latency'], s['success_rate']), fontsize=7, xytext=(3, 3),
+                        textcoords='offset points')
+    ax.set_xlabel('Mean latency (s)')
+    ax.set_ylabel('Success rate')
+    ax.set_ylim(-0.05, 1.05)
+    ax.legend(title='Prompt wording')
+    ax.grid(alpha=0.3)
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--corpus', type=Path, default=Path(__file__).parent / 'sweep_corpus.json')
+    parser.add_argument('--engine_dir', type=str, default=r'.\engines\Mistral-7B-Instruct-v0.2')
+    parser.add_argument('--tokenizer_dir', type=str, default=r'.\tokenizers\Mistral-7B-Instruct-v0.2')
+    parser.add_argument('--num_beams', type=int_list, default=[1])
+    parser.add_argument('--max_output_len', type=int_list, default=[256, 512, 1024])
+    parser.add_argument('--input_tokens_limit', type=int_list, default=[None],
+                        help="Comma-separated limits; 'none' means no limit")
+    parser.add_argument('--prompt_templates', type=str, default=','.join(prompt_templates))
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--output_dir', type=Path, default=Path('sweep'))
+    args = parser.parse_args()
+
+    from engine_swap import EngineSwapper
+    from text_generator import build_generator, read_engine_limits
+
+    corpus = json.loads(args.corpus.read_text())
+    for task in corpus:
+        # An identifier already in the starting code would pass even if the model ignored the request.
+        code = task.get('code') or starting_app_code(DemoType[task['demo_type']])
+        unchanged = [identifier for identifier in task['expected_identifiers'] if identifier in code]
+        if unchanged:
+            raise SystemExit(f"{task['request']!r}: {unchanged} already appear in the code before the edit")
+    limits = read_engine_limits(Path(args.engine_dir) / 'config.json')
+    templates = args.prompt_templates.split(',')
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    results = []
+    for num_beams, max_output_len, input_tokens_limit in itertools.product(args.num_beams, args.max_output_len,
+                                                                            args.input_tokens_limit):
+        if num_beams > (limits['max_beam_width'] or 1) or max_output_len > (limits['max_output_len'] or max_output_len):
+            print(f'Skipping num_beams={num_beams}, max_output_len={max_output_len}: beyond the engine limits')
+            continue
+        generator = build_generator(max_output_len=max_output_len, engine_dir=args.engine_dir,
+                                    tokenizer_dir=args.tokenizer_dir, num_beams=num_beams,
+                                    input_tokens_limit=input_tokens_limit)
+        for template, task, _ in itertools.product(templates, corpus, range(args.repeats)):
+            demo_type = DemoType[task['demo_type']]
+            code = task.get('code') or starting_app_code(demo_type)
+            start = time.perf_counter()
+            reply = generator.generate(edit_prompt(code, task['request'], prompt_templates[template]))
+            latency = time.perf_counter() - start
+            results.append({'num_beams': num_beams, 'max_output_len': max_output_len,
+                            'input_tokens_limit': input_tokens_limit, 'prompt_template': template,
+                            'demo_type': demo_type.name, 'request': task['request'], 'latency': latency,
+                            **score(reply, task['expected_identifiers'])})
+            print(f"{results[-1]['success']!s:5} {latency:6.2f}s b{num_beams} o{max_output_len} "
+                  f"i{input_tokens_limit} {template}: {task['request']}")
+        del generator
+        EngineSwapper.release_memory()
+
+    if not results:
+        raise SystemExit('No setting in the grid fits the engine')
+
+    with open(args.output_dir / 'results.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+    summaries = summarize(results)
+    (args.output_dir / 'summary.json').write_text(json.dumps(summaries, indent=2))
+    plot(summaries, args.output_dir / 'latency_vs_success.png')
+    print('| Beams | Max output | Input limit | Prompt | Mean latency (s) | Success rate | Compiles |')
+    print('|---|---|---|---|---|---|---|')
+    for s in sorted(summaries, key=lambda s: (-s['success_rate'], s['mean_latency'])):
+        print(f"| {s['num_beams']} | {s['max_output_len']} | {s['input_tokens_limit']} | {s['prompt_template']} | "
+              f"{s['mean_latency']:.2f} | {s['success_rate']:.0%} | {s['compile_rate']:.0%} |")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Checks that the JavaScript handlers templates.py renders for the UI parse, using `node --check`.
+
+The templates are pasted into JavaScript template literals, so a stray backtick or `${` in one of them breaks the whole
+handler. Run from the repository root with Node.js on the PATH: `python benchmarks/js_syntax_check.py`.
+"""
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from templates import (DemoType, append_delta_js, copy_share_link_js, copy_snippet_js,  # noqa: E402
+                       download_code_js, load_js, update_iframe_js)
+
+handlers = [load_js, update_iframe_js, copy_share_link_js, copy_snippet_js, download_code_js]
+
+
+def check(name: str, js: str, node: str) -> bool:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / f'{name}.js'
+        # Handlers are arrow function expressions, which need parentheses to stand alone as a script.
+        path.write_text(f'({js});\n', encoding='utf-8')
+        result = subprocess.run([node, '--check', str(path)], capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f'FAIL {name}\n{result.stderr}')
+        return False
+    print(f'ok   {name}')
+    return True
+
+
+def main():
+    node = shutil.which('node')
+    if node is None:
+        sys.exit('node was not found on the PATH')
+    rendered = {f'{handler.__name__}({demo_type.name})': handler(demo_type)
+                for handler in handlers for demo_type in DemoType}
+    rendered['append_delta_js'] = append_delta_js('gradio_bot_text')
+    results = [check(name, js, node) for name, js in rendered.items()]
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Checks the prefix KV cache on CPU with a small Hugging Face causal LM over a simulated multi-turn edit session.
+
+Each turn's greedy output with the cache must match the output without it; the script reports prefill time and the
+prompt tokens whose prefill was skipped. Run from the repository root, e.g.
+`python benchmarks/prefix_cache_check.py --model ./models/tiny-llama`.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import torch  # noqa: E402
+from transformers import AutoModelForCausalLM, AutoTokenizer  # noqa: E402
+
+from prefix_cache import PrefixKVCache, generate_greedy, prefill  # noqa: E402
+from templates import DemoType, edit_prompt, starting_app_code  # noqa: E402
+
+# Each turn edits the code a little, as accepted suggestions do, then asks for the next change.
+turns = [
+    ('Add a title to the app', lambda code: code),
+    ('Make the greeting louder', lambda code: code.replace('"Hello "', '"HELLO "')),
+    ('Add a second output box', lambda code: code.replace(
+        '    output = gr.Textbox(label="Output Box")\n',
+        '    output = gr.Textbox(label="Output Box")\n    shout = gr.Textbox(label="Shout")\n')),
+    ('Use a different theme', lambda code: code + '\n# TODO: theme\n'),
+    ('Explain the code', lambda code: code),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--model', type=str, required=True, help='Local path or hub id of a small causal LM')
+    parser.add_argument('--max_new_tokens', type=int, default=16)
+    parser.add_argument('--memory_budget_mb', type=float, default=256)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float32).eval()
+    cache = PrefixKVCache(int(args.memory_budget_mb * 2 ** 20))
+    code = starting_app_code(DemoType.GRADIO)
+
+    print('| Turn | Prompt tokens | Reused | Prefill without cache (ms) | Prefill with cache (ms) | Same output |')
+    print('|---|---|---|---|---|---|')
+    for turn, (request, edit) in enumerate(turns):
+        code = edit(code)
+        input_ids = tokenizer(edit_prompt(code, request), return_tensors='pt').input_ids
+        saved_before = cache.stats()['prefill_tokens_saved']
+
+        start = time.perf_counter()
+        prefill(model, input_ids)
+        uncached_ms = (time.perf_counter() - start) * 1000
+        # Time the cached prefill on its own, then check a full generation with the cache against one without.
+        start = time.perf_counter()
+        reused, past_key_values = cache.lookup(input_ids[0].numpy(), max_length=input_ids.shape[1] - 1)
+        with torch.no_grad():
+            model(input_ids[:, reused:], past_key_values=past_key_values, use_cache=True)
+        cached_ms = (time.perf_counter() - start) * 1000
+
+        expected = generate_greedy(model, input_ids, args.max_new_tokens, tokenizer.eos_token_id)
+        actual = generate_greedy(model, input_ids, args.max_new_tokens, tokenizer.eos_token_id, cache, 'session')
+        saved = cache.stats()['prefill_tokens_saved'] - saved_before
+        print(f'| {turn} | {input_ids.shape[1]} | {saved} | {uncached_ms:.1f} | {cached_ms:.1f} | '
+              f'{expected == actual} |')
+        if expected != actual:
+            raise SystemExit(f'Turn {turn}: cached generation {actual} differs from {expected}')
+    print(cache.stats())
+
+
+if __name__ == '__main__':
+    main()
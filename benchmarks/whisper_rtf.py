@@ -0,0 +1,82 @@
+"""Compares the real-time factor (processing time / audio duration) of the speech to text configurations.
+
+Run from the repository root, e.g. `python benchmarks/whisper_rtf.py --audio sample1.wav sample2.wav --threads 8`.
+"""
+import argparse
+import difflib
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import torch  # noqa: E402
+from transformers.pipelines.audio_utils import ffmpeg_read  # noqa: E402
+
+from speech_to_text import load_speech_to_text_pipeline, warm_up  # noqa: E402
+
+
+def word_agreement(text: str, reference: str) -> float:
+    return difflib.SequenceMatcher(None, text.lower().split(), reference.lower().split()).ratio()
+
+
+def benchmark(name: str, whisper_pipe, clips: [tuple], repeats: int, reference: [str] = None) -> (dict, [str]):
+    sampling_rate = whisper_pipe.feature_extractor.sampling_rate
+    warm_up(whisper_pipe)
+    texts = []
+    elapsed = 0.0
+    for audio_array in clips:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            text = whisper_pipe({'raw': audio_array, 'sampling_rate': sampling_rate})['text']
+            elapsed += time.perf_counter() - start
+        texts.append(text)
+    duration = sum(len(audio_array) for audio_array in clips) / sampling_rate * repeats
+    agreement = None
+    if reference is not None:
+        agreement = sum(word_agreement(t, r) for t, r in zip(texts, reference)) / len(texts)
+    return {'name': name, 'rtf': elapsed / duration, 'agreement': agreement}, texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--audio', type=Path, nargs='+', required=True, help='Speech clips in any format ffmpeg reads')
+    parser.add_argument('--threads', type=int, default=0, help='Intra-op threads for the CPU configurations')
+    parser.add_argument('--onnx_dir', type=str, default=None, help='ONNX export to include in the comparison')
+    parser.add_argument('--cuda', action='store_true', help='Also measure the GPU pipeline')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    configurations = [('cpu float32 (current CPU fallback)', dict(device='cpu', int8=False)),
+                      ('cpu int8 dynamic quantization', dict(device='cpu', int8=True))]
+    if args.onnx_dir:
+        configurations.append(('cpu onnxruntime', dict(device='cpu', onnx_dir=args.onnx_dir)))
+    if args.cuda and torch.cuda.is_available():
+        configurations.append(('cuda float16', dict(device='cuda:0')))
+
+    clips = None
+    reference = None
+    results = []
+    for name, options in configurations:
+        start = time.perf_counter()
+        whisper_pipe = load_speech_to_text_pipeline(threads=args.threads, **options)
+        load_time = time.perf_counter() - start
+        if clips is None:
+            sampling_rate = whisper_pipe.feature_extractor.sampling_rate
+            clips = [ffmpeg_read(path.read_bytes(), sampling_rate) for path in args.audio]
+        result, texts = benchmark(name, whisper_pipe, clips, args.repeats, reference)
+        # The first configuration is the baseline the others' transcripts are compared against.
+        reference = reference or texts
+        results.append({**result, 'load_time': load_time})
+        del whisper_pipe
+
+    print('| Configuration | Load (s) | RTF | Speed-up | Word agreement with baseline |')
+    print('|---|---|---|---|---|')
+    for result in results:
+        agreement = '-' if result['agreement'] is None else f"{result['agreement']:.1%}"
+        print(f"| {result['name']} | {result['load_time']:.1f} | {result['rtf']:.3f} | "
+              f"{results[0]['rtf'] / result['rtf']:.2f}x | {agreement} |")
+
+
+if __name__ == '__main__':
+    main()
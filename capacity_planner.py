@@ -0,0 +1,219 @@
+import argparse
+import json
+from pathlib import Path
+
+from text_generator import engine_file_path, read_engine_limits
+
+MiB = 2 ** 20
+GiB = 2 ** 30
+dtype_bytes = {'float32': 4, 'float16': 2, 'bfloat16': 2}
+# Flags of tensorrt_llm.quantization.QuantMode, so configs can be read without importing tensorrt_llm.
+INT4_WEIGHTS = 1
+INT8_WEIGHTS = 2
+PER_GROUP = 32
+INT8_KV_CACHE = 64
+FP8_KV_CACHE = 128
+# CUDA context, cuBLAS/TensorRT workspaces and the runtime's own buffers; measured roughly, varies by driver.
+default_overhead_mib = 500
+# distil-medium.en in float16 (394M parameters) when Whisper runs on the GPU.
+whisper_gpu_mib = 760
+
+
+def read_model_shape(config_path: Path) -> dict:
+    """Reads the shapes that determine memory use from an engine's config.json, per tensor/pipeline parallel rank."""
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    builder_config = config['builder_config']
+    plugin_config = config['plugin_config']
+    tp_size = builder_config['tensor_parallel']
+    pp_size = builder_config['pipeline_parallel']
+    num_heads = builder_config['num_heads']
+    num_kv_heads = 1 if builder_config.get('multi_query_mode', False) else builder_config.get('num_kv_heads',
+                                                                                                 num_heads)
+    hidden_size = builder_config['hidden_size']
+    # Llama's default MLP width; Mistral and other variants record theirs in the config.
+    inter_size = builder_config.get('mlp_hidden_size') or builder_config.get('inter_size') or \
+        256 * -(-(8 * hidden_size // 3) // 256)
+    return {
+        'name': builder_config.get('name', 'llama'),
+        'dtype': builder_config['precision'],
+        'tp_size': tp_size,
+        'pp_size': pp_size,
+        'num_layers': builder_config['num_layers'] // pp_size,
+        'num_heads': num_heads // tp_size,
+        'num_kv_heads': (num_kv_heads + tp_size - 1) // tp_size,
+        'head_size': hidden_size // num_heads,
+        'hidden_size': hidden_size,
+        'inter_size': inter_size // tp_size,
+        'vocab_size': builder_config['vocab_size'],
+        'quant_mode': builder_config.get('quant_mode', 0),
+        'group_size': builder_config.get('group_size', 128),
+        'paged_kv_cache': plugin_config.get('paged_kv_cache', False),
+        'tokens_per_block': plugin_config.get('tokens_per_block', 64),
+        'context_fmha': bool(plugin_config.get('context_fmha_type', 0)),
+        'gather_all_token_logits': builder_config.get('gather_all_token_logits', False),
+        **read_engine_limits(config_path),
+    }
+
+
+def estimate_weight_bytes(shape: dict) -> int:
+    """Parameters of a Llama-style decoder per rank, at the engine's weight precision."""
+    hidden_size = shape['hidden_size']
+    attention = hidden_size * (2 * shape['num_heads'] + 2 * shape['num_kv_heads']) * shape['head_size']
+    mlp = 3 * hidden_size * shape['inter_size']
+    linear_params = shape['num_layers'] * (attention + mlp)
+    word_bytes = dtype_bytes[shape['dtype']]
+    if shape['quant_mode'] & INT4_WEIGHTS:
+        linear_bytes = linear_params / 2
+    elif shape['quant_mode'] & INT8_WEIGHTS:
+        linear_bytes = linear_params
+    else:
+        linear_bytes = linear_params * word_bytes
+    if shape['quant_mode'] & PER_GROUP:
+        linear_bytes += linear_params / shape['group_size'] * word_bytes
+    # The embedding and lm_head stay unquantized; norms are negligible.
+    other_params = shape['vocab_size'] * hidden_size * (1 + 1 / shape['tp_size'])
+    return int(linear_bytes + other_params * word_bytes)
+
+
+def weight_bytes(engine_dir: Path, shape: dict) -> (int, str):
+    """The serialized engine's size when it is on disk, which is close to what it takes on the GPU."""
+    try:
+        path = engine_file_path(engine_dir, shape['dtype'], shape['tp_size'], shape['pp_size'], 0)
+    except FileNotFoundError:
+        return estimate_weight_bytes(shape), 'estimated from config'
+    return path.stat().st_size, f'size of {path.name}'
+
+
+def kv_cache_bytes(shape: dict, batch_size: int, input_len: int, output_len: int, num_beams: int = 1) -> int:
+    if shape['quant_mode'] & (INT8_KV_CACHE | FP8_KV_CACHE):
+        element_bytes = 1
+    else:
+        element_bytes = dtype_bytes[shape['dtype']]
+    tokens = input_len + output_len
+    if shape['paged_kv_cache']:
+        # Each sequence holds whole blocks.
+        tokens = -(-tokens // shape['tokens_per_block']) * shape['tokens_per_block']
+    bytes_per_token = shape['num_layers'] * shape['num_kv_heads'] * shape['head_size'] * 2 * element_bytes
+    return batch_size * num_beams * tokens * bytes_per_token
+
+
+def activation_bytes(shape: dict, batch_size: int, input_len: int, num_beams: int = 1) -> int:
+    """Peak intermediate tensors of the context phase, which processes every prompt token of the batch at once.
+
+    Layers run one after another and reuse the same memory, so this is one layer's MLP and residual tensors plus the
+    attention scores when fused multi-head attention is off, and the float32 logits.
+    """
+    word_bytes = dtype_bytes[shape['dtype']]
+    tokens = batch_size * input_len
+    layer = tokens * (3 * shape['inter_size'] + 4 * shape['hidden_size']) * word_bytes
+    if not shape['context_fmha']:
+        layer += batch_size * shape['num_heads'] * input_len * input_len * word_bytes
+    logits_rows = tokens if shape['gather_all_token_logits'] else batch_size * num_beams
+    return layer + logits_rows * shape['vocab_size'] * 4
+
+
+def plan(shape: dict, weights: int, batch_size: int, input_len: int, output_len: int, num_beams: int = 1,
+         overhead: int = default_overhead_mib * MiB) -> dict:
+    estimate = {
+        'weights': weights,
+        'kv_cache': kv_cache_bytes(shape, batch_size, input_len, output_len, num_beams),
+        'activations': activation_bytes(shape, batch_size, input_len, num_beams),
+        'overhead': overhead,
+    }
+    estimate['total'] = sum(estimate.values())
+    return estimate
+
+
+def largest_input_len(shape: dict, weights: int, budget: int, batch_size: int, output_len: int, num_beams: int,
+                      overhead: int) -> int:
+    """The longest prompt that fits the budget at this batch size, capped at the engine's max_input_len; 0 if none."""
+    low, high = 0, shape['max_input_len'] or 32768
+    while low < high:
+        middle = (low + high + 1) // 2
+        if plan(shape, weights, batch_size, middle, output_len, num_beams, overhead)['total'] <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def largest_batch_size(shape: dict, weights: int, budget: int, input_len: int, output_len: int, num_beams: int,
+                       overhead: int) -> int:
+    batch_size = 0
+    while batch_size < (shape['max_batch_size'] or 1) and plan(shape, weights, batch_size + 1, input_len, output_len,
+                                                               num_beams, overhead)['total'] <= budget:
+        batch_size += 1
+    return batch_size
+
+
+def recommend(shape: dict, weights: int, budget: int, output_len: int, num_beams: int, overhead: int) -> [dict]:
+    """For each batch size up to the engine's max_batch_size, the longest prompt that fits the budget."""
+    max_batch_size = shape['max_batch_size'] or 1
+    batch_sizes = sorted({2 ** i for i in range(max_batch_size.bit_length()) if 2 ** i <= max_batch_size} |
+                         {max_batch_size})
+    rows = []
+    for batch_size in batch_sizes:
+        input_len = largest_input_len(shape, weights, budget, batch_size, output_len, num_beams, overhead)
+        if input_len == 0:
+            break
+        rows.append({'batch_size': batch_size, 'input_len': input_len,
+                     **plan(shape, weights, batch_size, input_len, output_len, num_beams, overhead)})
+    return rows
+
+
+def print_plan(estimate: dict, extra: int = 0):
+    for part in ('weights', 'kv_cache', 'activations', 'overhead'):
+        print(f'    {part:<12} {estimate[part] / MiB:9.0f} MiB')
+    if extra:
+        print(f"    {'whisper':<12} {extra / MiB:9.0f} MiB")
+    print(f"    {'total':<12} {(estimate['total'] + extra) / MiB:9.0f} MiB")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Estimate GPU memory for an engine and find the largest batch/length settings that fit.')
+    parser.add_argument('--engine_dir', type=Path, default=Path(r'.\engines\Mistral-7B-Instruct-v0.2'))
+    parser.add_argument('--batch_size', type=int, default=1)
+    parser.add_argument('--input_len', type=int, default=None, help="Defaults to the engine's max_input_len")
+    parser.add_argument('--output_len', type=int, default=512, help="The app's max_output_len")
+    parser.add_argument('--num_beams', type=int, default=1)
+    parser.add_argument('--budget_gib', type=float, default=None,
+                        help='GPU memory available to the app, e.g. total VRAM less what the desktop already uses')
+    parser.add_argument('--overhead_mib', type=float, default=default_overhead_mib)
+    parser.add_argument('--whisper_gpu', action='store_true', help='Count Whisper running on the same GPU')
+    parser.add_argument('--measured_mib', type=float, default=None,
+                        help='Memory the app was measured using (nvidia-smi while running minus idle) to compare with')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    shape = read_model_shape(args.engine_dir / 'config.json')
+    weights, weights_source = weight_bytes(args.engine_dir, shape)
+    overhead = int(args.overhead_mib * MiB)
+    extra = whisper_gpu_mib * MiB if args.whisper_gpu else 0
+    input_len = args.input_len or shape['max_input_len']
+    kv_dtype = 'int8/fp8' if shape['quant_mode'] & (INT8_KV_CACHE | FP8_KV_CACHE) else shape['dtype']
+    print(f"{shape['name']} {shape['dtype']}, {shape['num_layers']} layers, {shape['num_kv_heads']} KV heads of "
+          f"{shape['head_size']} ({kv_dtype} cache, {'paged' if shape['paged_kv_cache'] else 'contiguous'}); "
+          f"weights {weights_source}")
+    print(f'batch {args.batch_size}, {input_len} input + {args.output_len} output tokens, {args.num_beams} beam(s):')
+    estimate = plan(shape, weights, args.batch_size, input_len, args.output_len, args.num_beams, overhead)
+    print_plan(estimate, extra)
+    if args.measured_mib:
+        predicted_mib = (estimate['total'] + extra) / MiB
+        print(f'    measured     {args.measured_mib:9.0f} MiB '
+              f'({(predicted_mib - args.measured_mib) / args.measured_mib:+.1%} predicted vs measured)')
+    if args.budget_gib:
+        budget = int(args.budget_gib * GiB) - extra
+        batch_size = largest_batch_size(shape, weights, budget, input_len, args.output_len, args.num_beams, overhead)
+        print(f"Largest batch for {input_len} + {args.output_len} tokens within {args.budget_gib:g} GiB: {batch_size} "
+              f"(engine max_batch_size {shape['max_batch_size']})")
+        print(f'Largest prompts that fit {args.budget_gib:g} GiB with {args.output_len} output tokens:')
+        rows = recommend(shape, weights, budget, args.output_len, args.num_beams, overhead)
+        if not rows:
+            print('    none; the weights and overhead alone exceed the budget')
+        for row in rows:
+            print(f"    batch {row['batch_size']:>3}: input_len {row['input_len']:>6} "
+                  f"({(row['total'] + extra) / MiB:.0f} MiB)")
@@ -0,0 +1,97 @@
+import math
+import threading
+from pathlib import Path
+
+from text_generator import StreamingGenerator, build_generator, encode_prompt, read_engine_limits
+from tracing import span
+
+
+class RoutedEngine:
+    def __init__(self, engine_dir: str, generator, max_input_len: int, max_output_len: int):
+        self.engine_dir = engine_dir
+        self.generator = generator
+        self.max_input_len = max_input_len
+        self.max_output_len = max_output_len
+        # Requests the engine can decode at once: one per worker replica, or one in-process.
+        self.capacity = getattr(generator, 'replicas', 1)
+        self.in_flight = 0
+
+    def saturated(self) -> bool:
+        return self.in_flight >= self.capacity
+
+
+class EngineRouter(StreamingGenerator):
+    """Routes each request to the smallest engine whose limits fit its estimated input and output tokens.
+
+    Engines are ordered by their max input and output lengths, so short edits land on a small fast engine and large
+    apps on a long-context one. When the preferred engine is busy the request goes to the next larger engine that fits
+    and is free, and only waits when all of them are busy. The reply rewrites the app's code, so the output estimate
+    scales with the prompt length.
+    """
+
+    def __init__(self, build_kwargs: dict, output_ratio: float = 1.0, output_margin: int = 64):
+        from transformers import LlamaTokenizerFast
+
+        self.build_kwargs = build_kwargs
+        self.max_output_len = build_kwargs['max_output_len']
+        self.num_beams = build_kwargs['num_beams']
+        self.tasks = build_kwargs['tasks']
+        self.input_tokens_limit = build_kwargs['input_tokens_limit']
+        self.output_ratio = output_ratio
+        self.output_margin = output_margin
+        self.tokenizer = LlamaTokenizerFast.from_pretrained(build_kwargs['tokenizer_dir'], legacy=False)
+        self.lock = threading.Lock()
+
+        self.engines = []
+        for engine_dir in (d.strip() for d in build_kwargs['engine_dirs'].split(',') if d.strip()):
+            limits = read_engine_limits(Path(engine_dir) / 'config.json')
+            max_input_len = limits['max_input_len'] or math.inf
+            # Never ask an engine for more output than it was built for.
+            max_output_len = min(self.max_output_len, limits['max_output_len'] or math.inf)
+            generator = build_generator(**{**build_kwargs, 'engine_dir': engine_dir, 'engine_dirs': None,
+                                           'max_output_len': max_output_len})
+            self.engines.append(RoutedEngine(engine_dir, generator, max_input_len, max_output_len))
+            print(f'Routing to {engine_dir}: max_input_len={max_input_len}, max_output_len={max_output_len}')
+        self.engines.sort(key=lambda e: (e.max_input_len, e.max_output_len))
+        self.replicas = sum(engine.capacity for engine in self.engines)
+
+    def estimate(self, input_text) -> (int, int):
+        input_length = len(encode_prompt(self.tokenizer, input_text, self.input_tokens_limit))
+        return input_length, int(input_length * self.output_ratio) + self.output_margin
+
+    def route(self, input_length: int, output_length: int) -> RoutedEngine:
+        # The largest engine takes prompts that fit nowhere; its generator truncates them to input_tokens_limit.
+        fitting = [e for e in self.engines if e.max_input_len >= input_length] or [self.engines[-1]]
+        preferred = [e for e in fitting if e.max_output_len >= output_length] or fitting[-1:]
+        for engine in preferred:
+            if not engine.saturated():
+                return engine
+        return min(preferred, key=lambda e: e.in_flight / e.capacity)
+
+    def request_key(self, input_text, prompt_table_name=None, tasks=None) -> tuple:
+        return input_text, self.max_output_len, self.num_beams, prompt_table_name, tasks or self.tasks
+
+    def stream(self, input_text, cancel_event: threading.Event = None, prompt_table_name=None, tasks=None):
+        with span('route') as route_span:
+            input_length, output_length = self.estimate(input_text)
+            with self.lock:
+                engine = self.route(input_length, output_length)
+                engine.in_flight += 1
+            route_span.update(engine_dir=engine.engine_dir, input_tokens=input_length,
+                              estimated_output_tokens=output_length)
+        try:
+            yield from engine.generator.stream(input_text, cancel_event, prompt_table_name, tasks)
+        finally:
+            with self.lock:
+                engine.in_flight -= 1
+
+    def generate(self, input_text, prompt_table_name=None, tasks=None):
+        text = ''
+        for text in self.stream(input_text, prompt_table_name=prompt_table_name, tasks=tasks):
+            pass
+        return text
+
+    def close(self):
+        for engine in self.engines:
+            if hasattr(engine.generator, 'close'):
+                engine.generator.close()
@@ -0,0 +1,149 @@
+import contextlib
+import gc
+import hmac
+import json
+import os
+import signal
+import threading
+import time
+import traceback
+from collections import Counter
+
+from text_generator import build_generator
+
+swap_route_path = '/kitewind/admin/swap_engine'
+# Callers send it as `Authorization: Bearer <token>`; the swap route is not mounted without one.
+admin_token = os.getenv('KITEWIND_ADMIN_TOKEN')
+warmup_prompt = 'Reply with the single word ready.'
+
+
+class EngineSwapper:
+    """Holds the active generator and swaps in a new engine without restarting the app.
+
+    The new engine is loaded and warmed up in the background while the current one keeps serving, so there must be
+    enough device memory for both engines during the swap. Requests that started on the old engine drain on it
+    before it is released; new requests go to the new engine as soon as it is validated.
+    """
+
+    def __init__(self, generator, scheduler=None):
+        self.generator = generator
+        # A RequestScheduler whose concurrency follows the generator's replicas.
+        self.scheduler = scheduler
+        self.in_flight = Counter()
+        self.condition = threading.Condition()
+        self.swap_lock = threading.Lock()
+        self.status = 'idle'
+
+    @contextlib.contextmanager
+    def acquire(self):
+        with self.condition:
+            generator = self.generator
+            self.in_flight[generator] += 1
+        try:
+            yield generator
+        finally:
+            with self.condition:
+                self.in_flight[generator] -= 1
+                self.condition.notify_all()
+
+    def swap(self, engine_dir: str = None):
+        """Builds, validates and switches to the engine in engine_dir (default: reload the current engine dir)."""
+        if not self.swap_lock.acquire(blocking=False):
+            raise RuntimeError('An engine swap is already in progress')
+        try:
+            build_kwargs = {**self.generator.build_kwargs}
+            if engine_dir is not None:
+                build_kwargs['engine_dir'] = engine_dir
+                # An explicit engine replaces a set of routed engines.
+                build_kwargs['engine_dirs'] = None
+            self.status = f"loading {build_kwargs['engine_dir']}"
+            print(f"Loading engine from {build_kwargs['engine_dir']} for hot swap...")
+            start = time.time()
+            new_generator = build_generator(**build_kwargs)
+            self.status = 'warming up'
+            warmup_reply = new_generator.generate(warmup_prompt)
+            if not warmup_reply:
+                raise RuntimeError('Warm-up generation returned no output')
+            with self.condition:
+                old_generator = self.generator
+                self.generator = new_generator
+            if self.scheduler is not None:
+                self.scheduler.resize(getattr(new_generator, 'replicas', 1))
+            print(f"Switched to engine {build_kwargs['engine_dir']} in {time.time() - start:.2f} seconds")
+            self.status = 'draining previous engine'
+            self.release(old_generator)
+            # Drop the last reference so the old engine's memory can actually be freed.
+            old_generator = None
+            self.release_memory()
+            self.status = 'idle'
+        except Exception:
+            self.status = 'idle'
+            raise
+        finally:
+            self.swap_lock.release()
+
+    def release(self, old_generator):
+        """Waits for requests still running on old_generator to finish, then closes it."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.in_flight[old_generator] == 0)
+            del self.in_flight[old_generator]
+        if hasattr(old_generator, 'close'):
+            # Worker pools release their engines by stopping their worker processes.
+            old_generator.close()
+
+    @staticmethod
+    def release_memory():
+        import torch
+        gc.collect()
+        torch.cuda.empty_cache()
+
+    def swap_in_background(self, engine_dir: str = None) -> threading.Thread:
+        def run():
+            try:
+                self.swap(engine_dir)
+            except Exception:
+                print('Engine hot swap failed; still serving the previous engine')
+                traceback.print_exc()
+
+        thread = threading.Thread(target=run, name='engine-swap', daemon=True)
+        thread.start()
+        return thread
+
+
+def install_swap_signal_handler(swapper: EngineSwapper):
+    """Reloads the current engine directory on SIGHUP, e.g. after rebuilding the engine in place (not on Windows)."""
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda signum, frame: swapper.swap_in_background())
+
+
+def mount_swap_route(app, swapper: EngineSwapper):
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse
+
+    if not admin_token:
+        print(f'KITEWIND_ADMIN_TOKEN is not set; {swap_route_path} is disabled')
+        return
+
+    async def swap_endpoint(request: Request) -> JSONResponse:
+        # Proxies and share tunnels make every request look local, so admin actions need the shared secret.
+        authorization = request.headers.get('authorization', '')
+        if not hmac.compare_digest(authorization.encode(), f'Bearer {admin_token}'.encode()):
+            return JSONResponse({'error': 'Missing or invalid admin token'}, status_code=401,
+                                headers={'WWW-Authenticate': 'Bearer'})
+        if request.method == 'GET':
+            return JSONResponse({'status': swapper.status})
+        # An empty body reloads the current engine directory.
+        raw_body = await request.body()
+        try:
+            body = json.loads(raw_body) if raw_body.strip() else {}
+        except json.JSONDecodeError as e:
+            return JSONResponse({'error': f'Malformed JSON body: {e}'}, status_code=400)
+        if not isinstance(body, dict):
+            return JSONResponse({'error': 'Expected a JSON object body'}, status_code=400)
+        if swapper.swap_lock.locked():
+            return JSONResponse({'error': 'An engine swap is already in progress', 'status': swapper.status},
+                                status_code=409)
+        swapper.swap_in_background(body.get('engine_dir'))
+        return JSONResponse({'status': 'started'}, status_code=202)
+
+    app.add_route(swap_route_path, swap_endpoint, methods=['GET', 'POST'])
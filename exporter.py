@@ -0,0 +1,118 @@
+import hashlib
+import json
+import re
+from collections import OrderedDict
+
+from templates import DemoType, html_template, snippet_template, export_route_path
+from vendored_assets import local_asset_path
+
+export_cache_size = 64
+export_cache = OrderedDict()
+
+placeholder_pattern = re.compile(r'STARTING_CODE|STARTING_REQUIREMENTS')
+stylesheet_pattern = re.compile(r'<link rel="stylesheet" href="([^"]+)"\s*/>')
+
+
+def unescape_template_literal(template: str) -> str:
+    # The template files are written to be embedded in JS template literals; resolve those escapes once here.
+    return re.sub(r'\\(.)', r'\1', template, flags=re.DOTALL)
+
+
+def escape_template_literal(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('`', '\\`').replace('${', '\\${').replace('</', '<\\/')
+
+
+def formatted_requirements(requirements: str) -> [str]:
+    return [x.strip() for x in (requirements or '').split('\n') if x.strip() and not x.startswith('#')]
+
+
+def minify_html(html: str) -> str:
+    # Only applied to the templates before code is substituted so user code keeps its formatting.
+    lines = (line.strip() for line in html.split('\n'))
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+def inline_stylesheets(html: str) -> str:
+    def inline(match: re.Match) -> str:
+        path = local_asset_path(match.group(1))
+        if path is None:
+            return match.group(0)
+        return f'<style>{path.read_text(encoding="utf-8")}</style>'
+
+    return stylesheet_pattern.sub(inline, html)
+
+
+def render_standalone(code: str, requirements: str, demo_type: DemoType) -> (str, str, str):
+    if demo_type == DemoType.GRADIO:
+        template = unescape_template_literal(html_template(demo_type))
+        rendered_requirements = escape_template_literal('\n'.join(formatted_requirements(requirements)))
+    elif demo_type == DemoType.STREAMLIT:
+        template = unescape_template_literal(html_template(demo_type))
+        rendered_requirements = ', '.join(json.dumps(x) for x in formatted_requirements(requirements)).replace(
+            '</', '<\\/')
+    else:
+        raise NotImplementedError(f'{demo_type} is not a supported demo type')
+    return template, escape_template_literal(code), rendered_requirements
+
+
+def render_snippet(code: str, requirements: str, demo_type: DemoType) -> (str, str, str):
+    # Snippets nest the app document inside a template literal so values are escaped for both levels.
+    if demo_type == DemoType.GRADIO:
+        template = unescape_template_literal(snippet_template(demo_type))
+        rendered_requirements = escape_template_literal(
+            escape_template_literal('\n'.join(formatted_requirements(requirements))))
+    elif demo_type == DemoType.STREAMLIT:
+        template = unescape_template_literal(snippet_template(demo_type))
+        rendered_requirements = escape_template_literal(
+            ', '.join(json.dumps(x) for x in formatted_requirements(requirements)))
+    else:
+        raise NotImplementedError(f'{demo_type} is not a supported demo type')
+    return template, escape_template_literal(escape_template_literal(code)), rendered_requirements
+
+
+def export_app(code: str, requirements: str, demo_type: DemoType, kind: str = 'standalone', minify: bool = True,
+               inline_assets: bool = False) -> (str, str):
+    """Renders an exported app, returning the html and its content hash; results are cached by that hash."""
+    key = json.dumps([demo_type.name, kind, minify, inline_assets, code, requirements or ''])
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    if digest in export_cache:
+        export_cache.move_to_end(digest)
+        return export_cache[digest], digest
+
+    if kind == 'standalone':
+        template, rendered_code, rendered_requirements = render_standalone(code, requirements, demo_type)
+    elif kind == 'snippet':
+        template, rendered_code, rendered_requirements = render_snippet(code, requirements, demo_type)
+    else:
+        raise ValueError(f'{kind} is not a supported export kind')
+    if inline_assets:
+        template = inline_stylesheets(template)
+    if minify:
+        template = minify_html(template)
+    # Substitute both placeholders in one pass so code that mentions a placeholder name is left alone.
+    values = {'STARTING_CODE': rendered_code, 'STARTING_REQUIREMENTS': rendered_requirements}
+    html = placeholder_pattern.sub(lambda match: values[match.group(0)], template)
+
+    export_cache[digest] = html
+    if len(export_cache) > export_cache_size:
+        export_cache.popitem(last=False)
+    return html, digest
+
+
+def mount_export_route(app):
+    from starlette.requests import Request
+    from starlette.responses import Response
+
+    async def export_endpoint(request: Request) -> Response:
+        try:
+            body = await request.json()
+            if not isinstance(body, dict):
+                raise ValueError('expected a JSON object body')
+            html, digest = export_app(body.get('code') or '', body.get('requirements') or '',
+                                      DemoType[body.get('demo_type', '')], kind=body.get('kind', 'standalone'),
+                                      inline_assets=bool(body.get('inline_assets')))
+        except (KeyError, ValueError, json.JSONDecodeError) as e:
+            return Response(f'Invalid export request: {e}', status_code=400)
+        return Response(html, media_type='text/html', headers={'ETag': f'"{digest}"'})
+
+    app.add_route(export_route_path, export_endpoint, methods=['POST'])
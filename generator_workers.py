@@ -0,0 +1,402 @@
+import atexit
+import contextlib
+import itertools
+import os
+import pickle
+import queue
+import struct
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+
+import numpy as np
+
+from text_generator import StreamingGenerator, encode_prompt, read_engine_limits
+from tracing import span
+
+# Stub workers have no engine limits to read, so their prompt buffer gets this many tokens.
+stub_max_input_len = 8192
+
+
+def send_message(stream, message):
+    payload = pickle.dumps(message)
+    stream.write(struct.pack('<I', len(payload)) + payload)
+    stream.flush()
+
+
+def read_message(stream):
+    header = stream.read(4)
+    if len(header) < 4:
+        raise EOFError
+    (size,) = struct.unpack('<I', header)
+    return pickle.loads(stream.read(size))
+
+
+def token_view(buffer: shared_memory.SharedMemory) -> np.ndarray:
+    return np.ndarray((buffer.size // 4,), dtype=np.int32, buffer=buffer.buf)
+
+
+# The output buffer starts with [sequence, length]. The child makes the sequence odd while it rewrites the tokens, which
+# can all change between steps with beam search, and even again once they are complete, so the parent can tell a
+# consistent copy from one taken mid-write.
+output_header_size = 2
+
+
+def write_output(output_view: np.ndarray, output_tokens: np.ndarray):
+    output_view[0] += 1
+    output_view[1] = len(output_tokens)
+    output_view[output_header_size:output_header_size + len(output_tokens)] = output_tokens
+    output_view[0] += 1
+
+
+def read_output(output_view: np.ndarray) -> (int, np.ndarray):
+    """Returns the sequence number and a copy of the latest complete output."""
+    while True:
+        sequence = int(output_view[0])
+        if not sequence % 2:
+            output_tokens = output_view[output_header_size:output_header_size + int(output_view[1])].copy()
+            if int(output_view[0]) == sequence:
+                return sequence, output_tokens
+        time.sleep(0)
+
+
+class GeneratorWorker:
+    """A generator hosted in a child process.
+
+    Control messages are pickled over the child's stdin and stdout; prompt and output token ids are passed through
+    shared memory so long prompts and replies are never pickled. The child is a plain subprocess rather than a
+    multiprocessing one so it doesn't re-import app.py, and it is its own single-rank MPI world so read_config's world
+    size check passes for each replica.
+    """
+
+    def __init__(self, index: int, device, build_kwargs: dict, stub: bool, max_input_len: int, max_output_len: int):
+        self.index = index
+        self.device = device
+        self.build_kwargs = build_kwargs
+        self.stub = stub
+        self.input_buffer = shared_memory.SharedMemory(create=True, size=max_input_len * 4)
+        self.output_buffer = shared_memory.SharedMemory(create=True, size=(output_header_size + max_output_len) * 4)
+        # Held while a request or a health check is using the worker.
+        self.lock = threading.Lock()
+        self.process = None
+        self.messages = None
+        self.restarts = 0
+        self.message_ids = itertools.count()
+
+    def start(self, timeout: float):
+        env = {k: v for k, v in os.environ.items() if not k.startswith(('OMPI_', 'PMI_'))}
+        if self.device is not None:
+            env['CUDA_VISIBLE_DEVICES'] = str(self.device)
+        self.process = subprocess.Popen([sys.executable, str(Path(__file__).resolve())],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+        # A fresh queue per process so nothing a crashed process sent is read by its replacement.
+        self.messages = queue.Queue()
+        threading.Thread(target=self.read_messages, args=(self.process, self.messages),
+                         name=f'generator-worker-{self.index}', daemon=True).start()
+        send_message(self.process.stdin, ('init', self.build_kwargs, self.input_buffer.name, self.output_buffer.name,
+                                          self.stub))
+        kind, *payload = self.receive(timeout)
+        if kind != 'ready':
+            self.stop()
+            raise RuntimeError(f'Generator worker {self.index} failed to start: {payload[-1] if payload else kind}')
+        print(f'Generator worker {self.index} ready (pid {self.process.pid}, device {self.device})')
+
+    @staticmethod
+    def read_messages(process: subprocess.Popen, messages: queue.Queue):
+        try:
+            while True:
+                messages.put(read_message(process.stdout))
+        except (EOFError, OSError):
+            messages.put(('exit', process.poll()))
+
+    def receive(self, timeout: float):
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f'Generator worker {self.index} did not respond within {timeout} seconds')
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def ping(self, timeout: float) -> bool:
+        message_id = next(self.message_ids)
+        try:
+            send_message(self.process.stdin, ('ping', message_id))
+            deadline = time.monotonic() + timeout
+            while True:
+                kind, *payload = self.receive(max(deadline - time.monotonic(), 0))
+                if kind == 'exit':
+                    return False
+                if kind == 'pong' and payload[0] == message_id:
+                    return True
+        except (OSError, TimeoutError):
+            return False
+
+    def stream_tokens(self, input_tokens: [int], cancel_event: threading.Event = None, **options):
+        """Yields the generated token ids so far; the caller must hold the worker's lock."""
+        input_view, output_view = token_view(self.input_buffer), token_view(self.output_buffer)
+        if len(input_tokens) > len(input_view):
+            raise ValueError(f'The prompt has {len(input_tokens)} tokens but the engine accepts at most '
+                             f'{len(input_view)}')
+        if not self.alive():
+            raise RuntimeError(f'Generator worker {self.index} is not running; it will be restarted shortly')
+        request_id = next(self.message_ids)
+        input_view[:len(input_tokens)] = input_tokens
+        send_message(self.process.stdin, ('generate', request_id, len(input_tokens), options))
+        finished = False
+        last_sequence = -1
+        try:
+            while cancel_event is None or not cancel_event.is_set():
+                try:
+                    kind, *payload = self.messages.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if kind == 'exit':
+                    finished = True
+                    raise RuntimeError(f'Generator worker {self.index} exited during generation')
+                if payload[0] != request_id:
+                    # Left over from a cancelled request.
+                    continue
+                if kind == 'step':
+                    # The child may already be writing a later step; read_output returns the newest complete one,
+                    # which the following step messages then skip.
+                    sequence, output_tokens = read_output(output_view)
+                    if sequence > last_sequence:
+                        last_sequence = sequence
+                        yield output_tokens
+                elif kind == 'done':
+                    finished = True
+                    return
+                elif kind == 'error':
+                    finished = True
+                    raise RuntimeError(f'Generator worker {self.index} failed: {payload[1]}')
+        finally:
+            if not finished:
+                with contextlib.suppress(OSError):
+                    send_message(self.process.stdin, ('cancel', request_id))
+
+    def stop(self, timeout: float = 10.0):
+        if self.process is None:
+            return
+        # A worker that failed to start was already stopped; close() stops it again.
+        if not self.process.stdin.closed:
+            with contextlib.suppress(OSError):
+                send_message(self.process.stdin, ('stop',))
+            with contextlib.suppress(OSError):
+                self.process.stdin.close()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def restart(self, timeout: float):
+        self.stop(timeout=1.0)
+        self.restarts += 1
+        self.start(timeout)
+
+    def close(self):
+        self.stop()
+        for buffer in (self.input_buffer, self.output_buffer):
+            buffer.close()
+            with contextlib.suppress(FileNotFoundError):
+                buffer.unlink()
+
+
+class GeneratorWorkerPool(StreamingGenerator):
+    """Runs one generator replica per worker process and spreads requests over the idle ones.
+
+    Tokenization and detokenization stay in the calling process; workers only see token ids. A monitor thread pings
+    idle workers and restarts any that crashed or stopped responding.
+    """
+
+    def __init__(self, build_kwargs: dict, health_interval: float = 10.0, health_timeout: float = 30.0,
+                 start_timeout: float = 600.0):
+        from transformers import LlamaTokenizerFast
+
+        self.build_kwargs = build_kwargs
+        self.max_output_len = build_kwargs['max_output_len']
+        self.num_beams = build_kwargs['num_beams']
+        self.tasks = build_kwargs['tasks']
+        self.input_tokens_limit = build_kwargs['input_tokens_limit']
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.start_timeout = start_timeout
+        self.tokenizer = LlamaTokenizerFast.from_pretrained(build_kwargs['tokenizer_dir'], legacy=False)
+
+        stub = build_kwargs['stub_workers']
+        if build_kwargs['worker_devices']:
+            devices = [d.strip() for d in build_kwargs['worker_devices'].split(',')]
+        else:
+            devices = [None if stub else str(i) for i in range(build_kwargs['workers'])]
+        if stub:
+            max_input_len = stub_max_input_len
+        else:
+            max_input_len = read_engine_limits(Path(build_kwargs['engine_dir']) / 'config.json')['max_input_len']
+        worker_kwargs = {**build_kwargs, 'workers': 0, 'worker_devices': None, 'stub_workers': False}
+        self.workers = [GeneratorWorker(i, device, worker_kwargs, stub, max_input_len, self.max_output_len)
+                        for i, device in enumerate(devices)]
+        self.replicas = len(self.workers)
+        self.closed = threading.Event()
+        atexit.register(self.close)
+
+        # Engines load in parallel, one per device.
+        with ThreadPoolExecutor(len(self.workers)) as executor:
+            starts = [executor.submit(worker.start, start_timeout) for worker in self.workers]
+        errors = [start.exception() for start in starts if start.exception() is not None]
+        if errors:
+            self.close()
+            raise errors[0]
+
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+        threading.Thread(target=self.monitor, name='generator-worker-monitor', daemon=True).start()
+
+    def monitor(self):
+        while not self.closed.wait(self.health_interval):
+            for worker in self.workers:
+                # Busy workers are skipped; if one crashes mid-request the request fails and the next check restarts it.
+                if not worker.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if self.closed.is_set():
+                        return
+                    if not worker.alive() or not worker.ping(self.health_timeout):
+                        print(f'Generator worker {worker.index} crashed or is unresponsive; restarting it')
+                        worker.restart(self.start_timeout)
+                except Exception:
+                    traceback.print_exc()
+                finally:
+                    worker.lock.release()
+
+    def request_key(self, input_text, prompt_table_name=None, tasks=None) -> tuple:
+        return input_text, self.max_output_len, self.num_beams, prompt_table_name, tasks or self.tasks
+
+    def stream(self, input_text, cancel_event: threading.Event = None, prompt_table_name=None, tasks=None):
+        with span('parse_input'):
+            input_tokens = encode_prompt(self.tokenizer, input_text, self.input_tokens_limit)
+        worker = self.idle.get()
+        try:
+            with worker.lock, span('worker.generate', worker=worker.index):
+                for output_tokens in worker.stream_tokens(input_tokens, cancel_event,
+                                                          prompt_table_name=prompt_table_name, tasks=tasks):
+                    with span('detokenize'):
+                        text = self.tokenizer.decode(output_tokens.tolist())
+                    yield text
+        finally:
+            self.idle.put(worker)
+
+    def generate(self, input_text, prompt_table_name=None, tasks=None):
+        text = ''
+        for text in self.stream(input_text, prompt_table_name=prompt_table_name, tasks=tasks):
+            pass
+        return text
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        for worker in self.workers:
+            worker.close()
+
+
+class StubTokenGenerator:
+    """Echoes the prompt back a few tokens at a time so the worker setup can be exercised without a GPU or engine."""
+
+    def __init__(self, max_output_len: int, streaming_interval: int = 5, step_delay: float = 0.01):
+        self.max_output_len = max_output_len
+        self.streaming_interval = streaming_interval
+        self.step_delay = step_delay
+
+    def stream_tokens(self, input_tokens, cancel_event=None, prompt_table_name=None, tasks=None):
+        output_tokens = np.asarray(input_tokens[-self.max_output_len:], dtype=np.int32)
+        for end in range(self.streaming_interval, len(output_tokens) + self.streaming_interval,
+                         self.streaming_interval):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            time.sleep(self.step_delay * self.streaming_interval)
+            yield output_tokens[:end]
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    buffer = shared_memory.SharedMemory(name=name)
+    if os.name == 'posix':
+        # Attaching registers the segment for cleanup when this process exits (before Python 3.13), but the parent
+        # owns it and hands it to the replacement worker after a crash.
+        resource_tracker.unregister(buffer._name, 'shared_memory')
+    return buffer
+
+
+def serve(messages_in, messages_out):
+    _, build_kwargs, input_name, output_name, stub = read_message(messages_in)
+    # The views don't keep the segments mapped, so the buffers are held for as long as the worker runs.
+    input_buffer, output_buffer = attach(input_name), attach(output_name)
+    input_view, output_view = token_view(input_buffer), token_view(output_buffer)
+    # A worker that crashed mid-write left the sequence odd.
+    output_view[0] += output_view[0] % 2
+    try:
+        if stub:
+            generator = StubTokenGenerator(build_kwargs['max_output_len'], build_kwargs['streaming_interval'])
+        else:
+            from text_generator import build_generator
+            generator = build_generator(**build_kwargs)
+    except Exception:
+        send_message(messages_out, ('error', None, traceback.format_exc()))
+        return
+    send_message(messages_out, ('ready', os.getpid()))
+
+    requests = queue.Queue()
+    cancel_events = {}
+
+    def read_requests():
+        # Runs beside generation so a cancel message can stop the request that is currently decoding.
+        try:
+            while True:
+                message = read_message(messages_in)
+                if message[0] == 'cancel':
+                    cancel_event = cancel_events.get(message[1])
+                    if cancel_event is not None:
+                        cancel_event.set()
+                    continue
+                if message[0] == 'generate':
+                    cancel_events[message[1]] = threading.Event()
+                requests.put(message)
+        except EOFError:
+            requests.put(('stop',))
+
+    threading.Thread(target=read_requests, daemon=True).start()
+    while True:
+        kind, *payload = requests.get()
+        if kind == 'stop':
+            break
+        if kind == 'ping':
+            send_message(messages_out, ('pong', payload[0]))
+        elif kind == 'generate':
+            request_id, input_length, options = payload
+            input_tokens = input_view[:input_length].copy()
+            try:
+                for output_tokens in generator.stream_tokens(input_tokens, cancel_events[request_id], **options):
+                    write_output(output_view, output_tokens)
+                    send_message(messages_out, ('step', request_id))
+                send_message(messages_out, ('done', request_id))
+            except Exception:
+                send_message(messages_out, ('error', request_id, traceback.format_exc()))
+            finally:
+                cancel_events.pop(request_id, None)
+
+
+if __name__ == '__main__':
+    # Messages use the original stdout; anything the engine prints goes to stderr instead.
+    messages_out = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    serve(sys.stdin.buffer, messages_out)
+    # The request reader thread is still blocked on stdin, so exit without finalizing the interpreter around it.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(0)
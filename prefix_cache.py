@@ -0,0 +1,169 @@
+import collections
+import hashlib
+import itertools
+import threading
+
+import numpy as np
+import torch
+
+from tracing import span
+
+
+class CachedPrefix:
+    def __init__(self, session: str, tokens: np.ndarray, past_key_values: tuple, block_hashes: [bytes]):
+        self.session = session
+        self.tokens = tokens
+        self.past_key_values = past_key_values
+        self.block_hashes = block_hashes
+        self.nbytes = sum(t.element_size() * t.nelement() for layer in past_key_values for t in layer)
+
+
+def slice_past(past_key_values: tuple, length: int) -> tuple:
+    # Each layer holds key and value tensors shaped [batch, heads, sequence, head_dim]; slicing returns views.
+    return tuple(tuple(t[:, :, :length] for t in layer) for layer in past_key_values)
+
+
+def legacy_past(past_key_values) -> tuple:
+    # Newer transformers versions return a Cache object; entries are kept in the tuple format all versions accept.
+    if hasattr(past_key_values, 'to_legacy_cache'):
+        return past_key_values.to_legacy_cache()
+    return past_key_values
+
+
+class PrefixKVCache:
+    """KV state of recent prompts, reused for the longest prefix a new prompt shares with any of them.
+
+    Consecutive turns of a session share the prompt wrapper and most of the code, so only the changed tail needs
+    prefill. Entries are indexed by a chained hash of every block_size-token prefix; a lookup hashes the new prompt
+    block by block and then compares tokens to extend the match past the last whole block. Entries are evicted least
+    recently used first once their tensors exceed memory_budget bytes, and each session keeps its most recent
+    max_entries_per_session prompts.
+    """
+
+    def __init__(self, memory_budget: int, block_size: int = 16, max_entries_per_session: int = 2):
+        self.memory_budget = memory_budget
+        self.block_size = block_size
+        self.max_entries_per_session = max_entries_per_session
+        self.entries = collections.OrderedDict()
+        self.block_index = {}
+        self.entry_ids = itertools.count()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.prefill_tokens = 0
+        self.prefill_tokens_saved = 0
+
+    def block_hashes(self, tokens: np.ndarray) -> [bytes]:
+        digest = hashlib.blake2b(digest_size=16)
+        hashes = []
+        for end in range(self.block_size, len(tokens) + 1, self.block_size):
+            digest.update(np.ascontiguousarray(tokens[end - self.block_size:end], dtype=np.int32).tobytes())
+            hashes.append(digest.copy().digest())
+        return hashes
+
+    def lookup(self, tokens: np.ndarray, max_length: int = None) -> (int, tuple):
+        """Returns the length of the longest cached prefix of tokens (at most max_length) and its KV state."""
+        max_length = len(tokens) if max_length is None else min(max_length, len(tokens))
+        with self.lock:
+            self.lookups += 1
+            entry_id = None
+            for block_hash in self.block_hashes(tokens[:max_length]):
+                entry_id = self.block_index.get(block_hash, entry_id)
+            if entry_id is None:
+                return 0, None
+            entry = self.entries[entry_id]
+            self.entries.move_to_end(entry_id)
+        # Compare the tokens themselves: this extends the match past the last whole block and rules out collisions.
+        length = min(max_length, len(entry.tokens))
+        mismatches = np.flatnonzero(entry.tokens[:length] != tokens[:length])
+        if len(mismatches):
+            length = int(mismatches[0])
+        if length == 0:
+            return 0, None
+        with self.lock:
+            self.hits += 1
+        return length, slice_past(entry.past_key_values, length)
+
+    def insert(self, session: str, tokens: np.ndarray, past_key_values: tuple):
+        entry = CachedPrefix(session, np.asarray(tokens, dtype=np.int32), past_key_values, self.block_hashes(tokens))
+        if entry.nbytes > self.memory_budget:
+            return
+        with self.lock:
+            for entry_id, other in list(self.entries.items()):
+                if other.session == session and np.array_equal(other.tokens, entry.tokens):
+                    self.evict(entry_id)
+            session_entries = [entry_id for entry_id, other in self.entries.items() if other.session == session]
+            for entry_id in session_entries[:max(len(session_entries) - self.max_entries_per_session + 1, 0)]:
+                self.evict(entry_id)
+            while self.entries and self.nbytes + entry.nbytes > self.memory_budget:
+                self.evict(next(iter(self.entries)))
+            entry_id = next(self.entry_ids)
+            self.entries[entry_id] = entry
+            self.nbytes += entry.nbytes
+            for block_hash in entry.block_hashes:
+                self.block_index[block_hash] = entry_id
+
+    def evict(self, entry_id: int):
+        entry = self.entries.pop(entry_id)
+        self.nbytes -= entry.nbytes
+        for block_hash in entry.block_hashes:
+            if self.block_index.get(block_hash) == entry_id:
+                del self.block_index[block_hash]
+                # Keep the prefix reachable through another entry that shares it.
+                for other_id, other in reversed(self.entries.items()):
+                    if block_hash in other.block_hashes:
+                        self.block_index[block_hash] = other_id
+                        break
+
+    def record(self, prompt_tokens: int, reused_tokens: int):
+        with self.lock:
+            self.prefill_tokens += prompt_tokens
+            self.prefill_tokens_saved += reused_tokens
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.nbytes,
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'prefill_tokens': self.prefill_tokens,
+                'prefill_tokens_saved': self.prefill_tokens_saved,
+                'prefill_saved_fraction': self.prefill_tokens_saved / max(self.prefill_tokens, 1),
+            }
+
+
+@torch.no_grad()
+def prefill(model, input_ids: torch.Tensor, cache: PrefixKVCache = None, session: str = None) -> (torch.Tensor,
+                                                                                                    tuple):
+    """Runs a Hugging Face causal LM over the prompt, reusing the longest cached prefix; returns the last logits
+    and the prompt's KV state."""
+    tokens = input_ids[0].cpu().numpy()
+    reused, past_key_values = 0, None
+    if cache is not None:
+        # At least one token has to be run to get logits for the next one.
+        reused, past_key_values = cache.lookup(tokens, max_length=len(tokens) - 1)
+    with span('prefill', prompt_tokens=len(tokens), reused_tokens=reused):
+        outputs = model(input_ids[:, reused:], past_key_values=past_key_values, use_cache=True)
+    past_key_values = legacy_past(outputs.past_key_values)
+    if cache is not None:
+        cache.insert(session, tokens, past_key_values)
+        cache.record(len(tokens), reused)
+    return outputs.logits[:, -1], past_key_values
+
+
+@torch.no_grad()
+def generate_greedy(model, input_ids: torch.Tensor, max_new_tokens: int, eos_token_id: int = None,
+                    cache: PrefixKVCache = None, session: str = None) -> [int]:
+    logits, past_key_values = prefill(model, input_ids, cache, session)
+    generated = []
+    for _ in range(max_new_tokens):
+        next_token = int(logits.argmax(-1)[0])
+        generated.append(next_token)
+        if next_token == eos_token_id:
+            break
+        outputs = model(torch.tensor([[next_token]], device=input_ids.device), past_key_values=past_key_values,
+                        use_cache=True)
+        logits, past_key_values = outputs.logits[:, -1], outputs.past_key_values
+    return generated
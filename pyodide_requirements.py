@@ -0,0 +1,60 @@
+import ast
+import json
+import sys
+from pathlib import Path
+
+from templates import DemoType
+
+pyodide_package_index = json.loads(Path('pyodide_packages.json').read_text())
+
+
+def imported_modules(code: str) -> [str]:
+    """Returns the absolute module names imported anywhere in the code, or an empty list if it does not parse."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.add(node.module)
+    return sorted(modules)
+
+
+def package_name(module: str) -> str:
+    import_to_package = pyodide_package_index['import_to_package']
+    parts = module.split('.')
+    # Prefer the most specific match so e.g. google.protobuf maps differently from other google.* modules.
+    for i in range(len(parts), 0, -1):
+        prefix = '.'.join(parts[:i])
+        if prefix in import_to_package:
+            return import_to_package[prefix]
+    return parts[0].replace('_', '-')
+
+
+def infer_requirements(code: str, demo_type: DemoType) -> [str]:
+    skipped = set(sys.stdlib_module_names)
+    skipped.update(pyodide_package_index['builtin'])
+    skipped.update(pyodide_package_index['preinstalled'][demo_type.name])
+    requirements = set()
+    for module in imported_modules(code):
+        if module.split('.')[0] in skipped or module in skipped:
+            continue
+        requirements.add(package_name(module))
+    return sorted(requirements)
+
+
+def merge_requirements(requirements: str, previously_inferred: [str], inferred: [str]) -> ([str], [str]):
+    """Returns the requirements box's lines with the inferred packages it lacks appended, and those packages.
+
+    The user's lines, comments included, are kept as typed. Packages appended by the previous call are dropped first so
+    one whose import was removed from the code goes away again.
+    """
+    lines = [line for line in (requirements or '').split('\n') if line.strip() not in previously_inferred]
+    while lines and not lines[-1].strip():
+        lines.pop()
+    listed = {line.strip() for line in lines if not line.strip().startswith('#')}
+    added = [package for package in inferred if package not in listed]
+    return lines + added, added
@@ -0,0 +1,120 @@
+import asyncio
+import collections
+import contextlib
+import time
+from enum import IntEnum
+
+
+class Priority(IntEnum):
+    # Lower values are served first.
+    TYPED = 0
+    VOICE = 1
+
+
+class QueueFull(Exception):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RequestScheduler:
+    """Admission control and per-session fair queuing in front of the generator.
+
+    Waiting requests are grouped by priority and then by session; within a priority sessions are served round robin so
+    one busy session cannot starve the others. Requests are rejected up front when the queue is full or the estimated
+    wait exceeds the SLO, rather than letting every queued request slowly time out.
+    """
+
+    def __init__(self, max_concurrency: int = 1, max_queue_depth: int = 16, wait_slo: float = 60.0,
+                 initial_service_time: float = 10.0, ewma_alpha: float = 0.2):
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.wait_slo = wait_slo
+        self.service_time = initial_service_time
+        self.ewma_alpha = ewma_alpha
+        self.running = 0
+        self.queues = {priority: collections.OrderedDict() for priority in Priority}
+        self.rejected = 0
+        self.loop = None
+
+    def queue_depth(self) -> int:
+        return sum(len(waiters) for queue in self.queues.values() for waiters in queue.values())
+
+    def estimate_wait(self, priority: Priority = Priority.TYPED) -> float:
+        # Requests of the same or higher priority are served first; lower priority ones wait behind this one.
+        ahead = sum(len(waiters) for p, queue in self.queues.items() if p <= priority for waiters in queue.values())
+        busy = ahead + self.running
+        if busy < self.max_concurrency:
+            return 0.0
+        return (busy - self.max_concurrency + 1) * self.service_time / self.max_concurrency
+
+    def admit(self, session: str, priority: Priority) -> float:
+        """Returns the estimated wait in seconds, or raises QueueFull with a retry hint when overloaded."""
+        estimated_wait = self.estimate_wait(priority)
+        if self.queue_depth() >= self.max_queue_depth or estimated_wait > self.wait_slo:
+            self.rejected += 1
+            retry_after = max(self.service_time, estimated_wait - self.wait_slo)
+            raise QueueFull(f'The assistant is busy right now; please retry in about {retry_after:.0f} seconds.',
+                            retry_after)
+        return estimated_wait
+
+    def resize(self, max_concurrency: int):
+        """Changes how many requests run at once, e.g. after an engine swap; safe to call from any thread."""
+        self.max_concurrency = max_concurrency
+        if self.loop is not None:
+            # Waiters are granted on the event loop; more capacity may let some start right away.
+            self.loop.call_soon_threadsafe(self.dispatch)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, session: str, priority: Priority):
+        self.loop = asyncio.get_running_loop()
+        if self.running < self.max_concurrency and not self.queue_depth():
+            self.running += 1
+        else:
+            granted = self.loop.create_future()
+            self.queues[priority].setdefault(session, collections.deque()).append(granted)
+            try:
+                await granted
+            except asyncio.CancelledError:
+                if granted.done() and not granted.cancelled():
+                    # The slot was handed over just as the request was abandoned; pass it on.
+                    self.release()
+                else:
+                    self.remove(priority, session, granted)
+                raise
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            self.service_time += self.ewma_alpha * (elapsed - self.service_time)
+            self.release()
+
+    def remove(self, priority: Priority, session: str, granted: asyncio.Future):
+        waiters = self.queues[priority].get(session)
+        if waiters is None:
+            return
+        with contextlib.suppress(ValueError):
+            waiters.remove(granted)
+        if not waiters:
+            del self.queues[priority][session]
+
+    def release(self):
+        self.running -= 1
+        self.dispatch()
+
+    def dispatch(self):
+        for priority in Priority:
+            queue = self.queues[priority]
+            while queue and self.running < self.max_concurrency:
+                session, waiters = next(iter(queue.items()))
+                granted = waiters.popleft()
+                if waiters:
+                    # Round robin: the session goes to the back of the line for its next request.
+                    queue.move_to_end(session)
+                else:
+                    del queue[session]
+                if granted.done():
+                    continue
+                self.running += 1
+                granted.set_result(None)
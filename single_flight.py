@@ -0,0 +1,77 @@
+import asyncio
+import typing
+
+
+class Flight:
+    """One in-flight generation shared by every caller that made the same request."""
+
+    def __init__(self):
+        self.deltas = []
+        self.subscribers = set()
+        self.changed = asyncio.Event()
+        self.finished = False
+        self.error = None
+        self.task = None
+
+    def publish(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """Coalesces identical concurrent async generator calls so the underlying work only runs once.
+
+    Callers that arrive while a flight for their key is running replay the deltas produced so far and then follow
+    it live. The source is cancelled only when every subscriber has gone away, and its error is raised to all of them.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.coalesced = 0
+
+    async def subscribe(self, key: typing.Hashable,
+                        source: typing.Callable[[], typing.AsyncIterator[str]]) -> typing.AsyncIterator[str]:
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = Flight()
+            self.flights[key] = flight
+            flight.task = asyncio.ensure_future(self.run(key, flight, source))
+        else:
+            self.coalesced += 1
+        subscriber = object()
+        flight.subscribers.add(subscriber)
+        position = 0
+        try:
+            while True:
+                while position < len(flight.deltas):
+                    yield flight.deltas[position]
+                    position += 1
+                if flight.finished:
+                    break
+                await flight.changed.wait()
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.subscribers.discard(subscriber)
+            if not flight.subscribers and not flight.finished:
+                # Nobody is listening anymore so stop the source; this frees the engine for other requests.
+                # Detach it first so an identical request arriving meanwhile starts a fresh flight.
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+                flight.task.cancel()
+
+    async def run(self, key: typing.Hashable, flight: Flight, source: typing.Callable[[], typing.AsyncIterator[str]]):
+        try:
+            async for delta in source():
+                flight.deltas.append(delta)
+                flight.publish()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.finished = True
+            # Later identical requests start a new flight instead of replaying a finished one.
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+            flight.publish()
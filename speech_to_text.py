@@ -0,0 +1,122 @@
+import os
+import queue
+import threading
+import time
+import typing
+from concurrent.futures import Future
+
+import numpy as np
+
+from tracing import span
+
+if typing.TYPE_CHECKING:
+    from transformers import Pipeline
+
+model_id = "distil-whisper/distil-medium.en"
+
+# 'auto' uses the GPU when there is one; 'cpu' keeps Whisper off the GPU so all of it is left for the LLM.
+whisper_device = os.getenv('KITEWIND_WHISPER_DEVICE', 'auto')
+# CPU only: dynamic int8 quantization of the linear layers, or an ONNX export (see README) loaded with onnxruntime.
+whisper_int8 = os.getenv('KITEWIND_WHISPER_INT8', '1') == '1'
+whisper_onnx_dir = os.getenv('KITEWIND_WHISPER_ONNX_DIR')
+whisper_threads = int(os.getenv('KITEWIND_WHISPER_THREADS', '0'))
+# Clips arriving within max_wait of the first one in a batch are transcribed together.
+whisper_max_batch_size = int(os.getenv('KITEWIND_WHISPER_MAX_BATCH_SIZE', '8'))
+whisper_max_wait = float(os.getenv('KITEWIND_WHISPER_MAX_WAIT_MS', '50')) / 1000
+
+
+def load_speech_to_text_pipeline(device: str = 'auto', int8: bool = True, onnx_dir: str = None,
+                                 threads: int = 0) -> 'Pipeline':
+    import torch
+    from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+
+    if device == 'auto':
+        device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    torch_dtype = torch.float32 if device == 'cpu' else torch.float16
+    processor = AutoProcessor.from_pretrained(model_id)
+
+    if device == 'cpu':
+        if threads:
+            torch.set_num_threads(threads)
+        if onnx_dir:
+            import onnxruntime
+            from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+
+            session_options = onnxruntime.SessionOptions()
+            if threads:
+                session_options.intra_op_num_threads = threads
+            model = ORTModelForSpeechSeq2Seq.from_pretrained(onnx_dir, session_options=session_options)
+        else:
+            model = AutoModelForSpeechSeq2Seq.from_pretrained(model_id, torch_dtype=torch_dtype,
+                                                              use_safetensors=True)
+            if int8:
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        model = AutoModelForSpeechSeq2Seq.from_pretrained(
+            model_id, torch_dtype=torch_dtype, use_safetensors=True
+        )
+        model.to(device)
+
+    return pipeline(
+        "automatic-speech-recognition",
+        model=model,
+        tokenizer=processor.tokenizer,
+        feature_extractor=processor.feature_extractor,
+        max_new_tokens=128,
+        torch_dtype=torch_dtype,
+        device=None if onnx_dir and device == 'cpu' else device,
+    )
+
+
+def warm_up(whisper_pipe: 'Pipeline', seconds: float = 1.0) -> float:
+    """Transcribes a short silent clip so one-time kernel and graph setup doesn't land on the first user."""
+    sampling_rate = whisper_pipe.feature_extractor.sampling_rate
+    start = time.time()
+    whisper_pipe({'raw': np.zeros(int(seconds * sampling_rate), dtype=np.float32), 'sampling_rate': sampling_rate})
+    return time.time() - start
+
+
+class TranscriptionBatcher:
+    """Transcribes clips from concurrent requests in padded batches on a single background thread.
+
+    A batch is started by the first waiting clip and closes after max_wait seconds or at max_batch_size clips, so a
+    lone request pays at most max_wait of extra latency.
+    """
+
+    def __init__(self, whisper_pipe: 'Pipeline', max_batch_size: int = 8, max_wait: float = 0.05):
+        self.whisper_pipe = whisper_pipe
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.sampling_rate = whisper_pipe.feature_extractor.sampling_rate
+        self.pending = queue.Queue()
+        threading.Thread(target=self.run, name='transcription-batcher', daemon=True).start()
+
+    def transcribe(self, audio_array: np.ndarray) -> str:
+        future = Future()
+        self.pending.put((audio_array, future))
+        return future.result()
+
+    def collect(self) -> list:
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.pending.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect()
+            inputs = [{'raw': audio_array, 'sampling_rate': self.sampling_rate} for audio_array, _ in batch]
+            try:
+                # The pipeline pads the clips' features to a common length and runs them through the model together.
+                with span('whisper.batch', batch_size=len(batch)):
+                    results = self.whisper_pipe(inputs, batch_size=len(batch))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result['text'])
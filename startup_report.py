@@ -0,0 +1,69 @@
+import argparse
+import re
+import subprocess
+import sys
+import time
+
+# Modules the CLI and test tooling import; they must not pull in the GPU/UI stack at import time.
+slim_modules = ['templates', 'exporter', 'pyodide_requirements', 'tracing', 'scheduler', 'single_flight',
+                'text_generator', 'engine_swap', 'engine_router', 'generator_workers', 'batch_generate',
+                'speech_to_text', 'capacity_planner']
+heavy_packages = ['torch', 'transformers', 'tensorrt_llm', 'tensorrt', 'gradio']
+
+importtime_pattern = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+
+def import_profile(module: str) -> dict:
+    """Imports module in a fresh interpreter with -X importtime and returns its import timings."""
+    probe = f'import sys, {module}; print(",".join(m for m in {heavy_packages!r} if m in sys.modules))'
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe], capture_output=True, text=True)
+    wall_time = time.perf_counter() - start
+    if result.returncode != 0:
+        return {'module': module, 'error': result.stderr.strip().splitlines()[-1]}
+    # Nested imports are listed, indented, before the import that triggered them.
+    timings, import_time = [], None
+    for line in result.stderr.splitlines():
+        match = importtime_pattern.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        if not indent:
+            if name == module:
+                import_time = int(cumulative_us) / 1e6
+                break
+            timings = []
+        elif len(indent) == 2:
+            timings.append({'name': name, 'self': int(self_us) / 1e6, 'cumulative': int(cumulative_us) / 1e6})
+    return {'module': module, 'wall_time': wall_time, 'import_time': import_time, 'timings': timings,
+            'heavy': [m for m in result.stdout.strip().split(',') if m]}
+
+
+def print_report(profile: dict, top: int):
+    if 'error' in profile:
+        print(f"{profile['module']}: import failed ({profile['error']})")
+        return
+    heavy = ', '.join(profile['heavy']) or 'none'
+    print(f"{profile['module']}: {profile['import_time']:.3f}s import, {profile['wall_time']:.3f}s process start; "
+          f"heavy packages loaded: {heavy}")
+    # The module's direct imports, each including everything it imported in turn.
+    for timing in sorted(profile['timings'], key=lambda t: -t['cumulative'])[:top]:
+        print(f"    {timing['cumulative']:8.3f}s  {timing['name']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report import time per module, like python -X importtime.')
+    parser.add_argument('modules', nargs='*', default=slim_modules,
+                        help='Modules to profile (default: the slim modules); app starts the whole app')
+    parser.add_argument('--top', type=int, default=10, help='Slowest imports to list per module')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit with an error if a slim module imports a heavy package')
+    args = parser.parse_args()
+    failures = []
+    for module in args.modules:
+        profile = import_profile(module)
+        print_report(profile, args.top)
+        if module in slim_modules and profile.get('heavy'):
+            failures.append(module)
+    if args.check and failures:
+        raise SystemExit(f"Slim modules importing heavy packages: {', '.join(failures)}")
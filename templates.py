@@ -1,16 +1,55 @@
+import functools
+import json
+import re
 from enum import Enum
 from pathlib import Path
 
+from vendored_assets import localize_asset_urls
+
 
 class DemoType(Enum):
     GRADIO = 1
     STREAMLIT = 2
 
 
-gradio_lite_html_template = Path('templates/gradio-lite/gradio-lite-template.html').read_text()
-stlite_html_template = Path('templates/stlite/stlite-template.html').read_text()
-gradio_lite_snippet_template = Path('templates/gradio-lite/gradio-lite-snippet-template.html').read_text()
-stlite_snippet_template = Path('templates/stlite/stlite-snippet-template.html').read_text()
+# Served by exporter.mount_export_route; exported apps are rendered server side.
+export_route_path = '/kitewind/export'
+
+# The code comes first so consecutive turns share a long prompt prefix whose KV state can be reused.
+edit_prompt_template = "```python\n{code}```\nGiven the code above return only updated code for the following request:\n{prompt}\n"
+# Extracts the updated code from the assistant's reply.
+code_pattern = re.compile(r'```python\n(.*?)```', re.DOTALL)
+
+# Upper bound on waiting for a stlite rerun to report back; normally updates resolve as soon as the rerun finishes.
+STLITE_RERUN_TIMEOUT_MS = 5000
+
+
+template_prefixes = {DemoType.GRADIO: 'templates/gradio-lite/gradio-lite', DemoType.STREAMLIT: 'templates/stlite/stlite'}
+
+
+# Templates are read on first use rather than at import so tools that only need the helpers here start quickly.
+@functools.lru_cache(maxsize=None)
+def html_template(demo_type: DemoType) -> str:
+    return Path(f'{template_prefixes[demo_type]}-template.html').read_text()
+
+
+@functools.lru_cache(maxsize=None)
+def snippet_template(demo_type: DemoType) -> str:
+    return Path(f'{template_prefixes[demo_type]}-snippet-template.html').read_text()
+
+
+@functools.lru_cache(maxsize=None)
+def iframe_template(demo_type: DemoType) -> str:
+    # The in-app iframes load runtime assets from the local server when they have been vendored; exports keep CDN URLs.
+    template = localize_asset_urls(html_template(demo_type))
+    if demo_type == DemoType.STREAMLIT:
+        stlite_rerun_hook = Path('templates/stlite/stlite-rerun-hook.js').read_text()
+        template = template.replace('</body>', f'<script>\n{stlite_rerun_hook}</script>\n</body>')
+    return template
+
+
+def edit_prompt(code: str, prompt: str, template: str = edit_prompt_template) -> str:
+    return template.format(code=code, prompt=prompt)
 
 
 def starting_app_code(demo_type: DemoType) -> str:
@@ -63,9 +102,9 @@ def load_js(demo_type: DemoType) -> str:
             const div = document.getElementById('gradioDemoDiv');
             div.appendChild(iframe);
 
-            let template = `{gradio_lite_html_template.replace('STARTING_CODE', starting_app_code(demo_type))}`;    
+            let template = `{iframe_template(demo_type).replace('STARTING_CODE', starting_app_code(demo_type))}`;    
             if (codeValue) {{
-                template = `{gradio_lite_html_template}`.replace('STARTING_CODE', codeValue.replaceAll(String.fromCharCode(92), String.fromCharCode(92) + String.fromCharCode(92)).replaceAll('`', String.fromCharCode(92) + '`'));
+                template = `{iframe_template(demo_type)}`.replace('STARTING_CODE', codeValue.replaceAll(String.fromCharCode(92), String.fromCharCode(92) + String.fromCharCode(92)).replaceAll('`', String.fromCharCode(92) + '`'));
             }}
             template = template.replace('STARTING_REQUIREMENTS', requirementsValue || '');
             const frame = document.getElementById('gradio-iframe');
@@ -115,9 +154,9 @@ def load_js(demo_type: DemoType) -> str:
             const div = document.getElementById('stliteDemoDiv');
             div.appendChild(iframe);
             
-            let template = `{stlite_html_template.replace('STARTING_CODE', starting_app_code(demo_type))}`;
+            let template = `{iframe_template(demo_type).replace('STARTING_CODE', starting_app_code(demo_type))}`;
             if (codeValue) {{
-                template = `{stlite_html_template}`.replace('STARTING_CODE', codeValue.replaceAll(String.fromCharCode(92), String.fromCharCode(92) + String.fromCharCode(92)).replaceAll('`', String.fromCharCode(92) + '`'));
+                template = `{iframe_template(demo_type)}`.replace('STARTING_CODE', codeValue.replaceAll(String.fromCharCode(92), String.fromCharCode(92) + String.fromCharCode(92)).replaceAll('`', String.fromCharCode(92) + '`'));
             }}
             const formattedRequirements = (requirementsValue || '').split('\\n').filter(x => x && !x.startsWith('#')).map(x => x.trim());
             template = template.replace('STARTING_REQUIREMENTS', formattedRequirements.map(x => `"${{x}}"`).join(', ') || '');
@@ -132,8 +171,10 @@ def load_js(demo_type: DemoType) -> str:
 
 def update_iframe_js(demo_type: DemoType) -> str:
     if demo_type == DemoType.GRADIO:
-        return f"""async (code, requirements, lastError, codeHistory, codeHistoryIndex) => {{
-                const formattedRequirements = requirements.split('\\n').filter(x => x && !x.startsWith('#')).map(x => x.trim());
+        return f"""async (code, requirements) => {{
+                const formattedRequirements = (requirements || '').split('\\n').filter(x => x && !x.startsWith('#')).map(x => x.trim());
+                // The box is returned as typed, comments included, with any modules installed on the fly appended.
+                const typedRequirements = (requirements || '').trimEnd();
                 let errorResult = null;
                 const attemptedRequirements = new Set();
                 const installedRequirements = [];
@@ -156,7 +197,8 @@ def update_iframe_js(demo_type: DemoType) -> str:
                             demoFrameWindow.document.head.appendChild(oldStyle);
                         }}
                         
-                        // If the error is caused by a missing module try once to install it and update again.
+                        // Requirements are inferred from imports on the server; as a fallback for modules it could not map,
+                    // if the error is caused by a missing module try once to install it and update again.
                         if (e.toString().includes('ModuleNotFoundError')) {{
                             try {{
                                 const guessedModuleName = e.toString().split("'")[1].replaceAll('_', '-');
@@ -179,13 +221,13 @@ def update_iframe_js(demo_type: DemoType) -> str:
                         const appBody = demoFrameWindow.document.querySelectorAll("div.main > div")[1];
                         appBody.style.visibility = "hidden";
                         errorResult = e.toString();
-                        const allRequirements = formattedRequirements.concat(installedRequirements);
-                        return [code, allRequirements, errorResult, codeHistory, codeHistoryIndex];
+                        const allRequirements = (typedRequirements ? [typedRequirements] : []).concat(installedRequirements);
+                        return [allRequirements.join('\\n'), errorResult];
                     }}
                 }};
                 await update();
                 
-                const allRequirements = formattedRequirements.concat(installedRequirements);
+                const allRequirements = (typedRequirements ? [typedRequirements] : []).concat(installedRequirements);
                 // Update URL query params to include the current demo code state
                 const currentUrl = new URL(window.location.href);
                 currentUrl.searchParams.set('type', 'gradio');
@@ -198,11 +240,13 @@ def update_iframe_js(demo_type: DemoType) -> str:
                 // Replace the current URL with the updated one
                 history.replaceState({{}}, '', currentUrl.href);
                 
-                return [code, allRequirements, errorResult, codeHistory, codeHistoryIndex];
+                return [allRequirements.join('\\n'), errorResult];
             }}"""
     elif demo_type == DemoType.STREAMLIT:
-        return f"""async (code, requirements, lastError, codeHistory, codeHistoryIndex) => {{
+        return f"""async (code, requirements) => {{
             const formattedRequirements = (requirements || '').split('\\n').filter(x => x && !x.startsWith('#')).map(x => x.trim());
+            // The box is returned as typed, comments included, with any modules installed on the fly appended.
+            const typedRequirements = (requirements || '').trimEnd();
             let errorResult = null;
             const attemptedRequirements = new Set();
             const installedRequirements = [];
@@ -215,17 +259,18 @@ def update_iframe_js(demo_type: DemoType) -> str:
                     const newCode = code + ` # Update tag ${{Math.random()}}`;
                     const entrypointFile = "streamlit_app.py";
                     // As code rerun happens inside streamlit this won't throw an error for self-healing imports.
+                    // So instead the hook injected into the iframe watches the rerun and reports any error banner;
+                    // it starts observing before the write so fast reruns are not missed.
+                    const rerunError = document.getElementById('stlite-iframe').contentWindow.waitForStliteRerun({STLITE_RERUN_TIMEOUT_MS});
                     await appController.writeFile(entrypointFile, newCode);
-                    // So instead wait 500 milliseconds to see if the streamlit error banner appeared with an error.
-                    // TODO: Consider a way to make this not rely on streamlit refresh timing; otherwise user can just re-update and this will trigger.
-                    await new Promise(r => setTimeout(r, 500));
-                    const messageDiv = document.getElementById('stlite-iframe').contentWindow.document.querySelector('.message');
-                    if (messageDiv) {{
-                        throw Error(messageDiv.innerHTML);
+                    const messageHtml = await rerunError;
+                    if (messageHtml) {{
+                        throw Error(messageHtml);
                     }}
                 }}
                 catch (e) {{                    
-                    // If the error is caused by a missing module try once to install it and update again.
+                    // Requirements are inferred from imports on the server; as a fallback for modules it could not map,
+                    // if the error is caused by a missing module try once to install it and update again.
                     if (e.toString().includes('ModuleNotFoundError')) {{
                         try {{
                             const guessedModuleName = e.toString().split("'")[1].replaceAll('_', '-');
@@ -244,13 +289,13 @@ def update_iframe_js(demo_type: DemoType) -> str:
                     }}
                     
                     errorResult = e.toString();
-                    const allRequirements = formattedRequirements.concat(installedRequirements);
-                    return [code, allRequirements, errorResult, codeHistory, codeHistoryIndex];
+                    const allRequirements = (typedRequirements ? [typedRequirements] : []).concat(installedRequirements);
+                    return [allRequirements.join('\\n'), errorResult];
                 }}
             }};
             await update();
             
-            const allRequirements = formattedRequirements.concat(installedRequirements);
+            const allRequirements = (typedRequirements ? [typedRequirements] : []).concat(installedRequirements);
             // Update URL query params to include the current demo code state
             const currentUrl = new URL(window.location.href);
             currentUrl.searchParams.set('type', 'streamlit');
@@ -263,7 +308,7 @@ def update_iframe_js(demo_type: DemoType) -> str:
             // Replace the current URL with the updated one
             history.replaceState({{}}, '', currentUrl.href);
             
-            return [code, allRequirements, errorResult, codeHistory, codeHistoryIndex];
+            return [allRequirements.join('\\n'), errorResult];
         }}"""
     raise NotImplementedError(f'{demo_type} is not a supported demo type')
 
@@ -295,77 +340,90 @@ def copy_share_link_js(demo_type: DemoType) -> str:
 
 
 def copy_snippet_js(demo_type: DemoType) -> str:
+    if demo_type not in (DemoType.GRADIO, DemoType.STREAMLIT):
+        raise NotImplementedError(f'{demo_type} is not a supported demo type')
+    return f"""async (code, requirements) => {{
+        // The snippet is rendered and cached on the server; see exporter.py
+        const response = await fetch('{export_route_path}', {{
+            method: 'POST',
+            headers: {{'Content-Type': 'application/json'}},
+            body: JSON.stringify({{demo_type: '{demo_type.name}', kind: 'snippet', code: code, requirements: requirements}})
+        }});
+        const snippet = await response.text();
+        if (!response.ok) {{
+            // Leave the clipboard alone rather than copying the error text; no code tells copy_notify nothing was copied.
+            alert(`Could not export the snippet: ${{snippet}}`);
+            return [null, null];
+        }}
+        await navigator.clipboard.writeText(snippet);
+        return [code, requirements];
+    }}"""
+
+
+def download_code_js(demo_type: DemoType) -> str:
     if demo_type == DemoType.GRADIO:
-        return f"""async (code, requirements) => {{
-            const escapedCode = code.replaceAll(String.fromCharCode(92), String.fromCharCode(92) + String.fromCharCode(92) + String.fromCharCode(92) + String.fromCharCode(92)).replaceAll('`', String.fromCharCode(92) + '`');
-            const template = `{gradio_lite_snippet_template}`;
-            // Step 1: Generate the HTML content
-            const completedTemplate = template.replace('STARTING_CODE', escapedCode).replace('STARTING_REQUIREMENTS', requirements);
-            const snippet = completedTemplate;
-            await navigator.clipboard.writeText(snippet);
-            return [code, requirements];
-        }}"""
+        filename = "gradio-lite-app.html"
     elif demo_type == DemoType.STREAMLIT:
-        return f"""async (code, requirements) => {{
-            const escapedCode = code.replaceAll(String.fromCharCode(92), String.fromCharCode(92) + String.fromCharCode(92) + String.fromCharCode(92)).replaceAll('`', String.fromCharCode(92) + '`');
-            const template = `{stlite_snippet_template}`;
-            // Step 1: Generate the HTML content
-            const formattedRequirements = (requirements || '').split('\\n').filter(x => x && !x.startsWith('#')).map(x => x.trim());
-            const completedTemplate = template.replace('STARTING_CODE', code).replace('STARTING_REQUIREMENTS', formattedRequirements.map(x => `"${{x}}"`).join(', ') || '');
-            
-            const snippet = completedTemplate;            
-            await navigator.clipboard.writeText(snippet);
-            return [code, requirements];
-        }}"""
-    raise NotImplementedError(f'{demo_type} is not a supported demo type')
+        filename = "stlite-app.html"
+    else:
+        raise NotImplementedError(f'{demo_type} is not a supported demo type')
+    return f"""async (code, requirements) => {{
+        // Step 1: Render the HTML content on the server; repeated exports of the same app are served from its cache
+        const response = await fetch('{export_route_path}', {{
+            method: 'POST',
+            headers: {{'Content-Type': 'application/json'}},
+            body: JSON.stringify({{demo_type: '{demo_type.name}', kind: 'standalone', code: code, requirements: requirements}})
+        }});
+        const completedTemplate = await response.text();
+        if (!response.ok) {{
+            alert(`Could not export the app: ${{completedTemplate}}`);
+            return;
+        }}
 
+        // Step 2: Create a Blob from the HTML content
+        const blob = new Blob([completedTemplate], {{ type: "text/html" }});
 
-def download_code_js(demo_type: DemoType) -> str:
-    if demo_type == demo_type.GRADIO:
-        return f"""(code, requirements) => {{
-            const escapedCode = code.replaceAll(String.fromCharCode(92), String.fromCharCode(92) + String.fromCharCode(92)).replaceAll('`', String.fromCharCode(92) + '`');
-            // Step 1: Generate the HTML content
-            const completedTemplate = `{gradio_lite_html_template}`.replace('STARTING_CODE', escapedCode).replace('STARTING_REQUIREMENTS', requirements);
+        // Step 3: Create a URL for the Blob
+        const url = URL.createObjectURL(blob);
 
-            // Step 2: Create a Blob from the HTML content
-            const blob = new Blob([completedTemplate], {{ type: "text/html" }});
+        // Step 4: Create a download link
+        const downloadLink = document.createElement("a");
+        downloadLink.href = url;
+        downloadLink.download = "{filename}"; // Specify the filename for the download
 
-            // Step 3: Create a URL for the Blob
-            const url = URL.createObjectURL(blob);
+        // Step 5: Trigger a click event on the download link
+        downloadLink.click();
 
-            // Step 4: Create a download link
-            const downloadLink = document.createElement("a");
-            downloadLink.href = url;
-            downloadLink.download = "gradio-lite-app.html"; // Specify the filename for the download
+        // Clean up by revoking the URL
+        URL.revokeObjectURL(url);
+    }}"""
 
-            // Step 5: Trigger a click event on the download link
-            downloadLink.click();
 
-            // Clean up by revoking the URL
-            URL.revokeObjectURL(url);
-        }}"""
-    elif demo_type == demo_type.STREAMLIT:
-        return f"""(code, requirements) => {{
-            const escapedCode = code.replaceAll(String.fromCharCode(92), String.fromCharCode(92) + String.fromCharCode(92)).replaceAll('`', String.fromCharCode(92) + '`');
-            // Step 1: Generate the HTML content
-            const formattedRequirements = (requirements || '').split('\\n').filter(x => x && !x.startsWith('#')).map(x => x.trim());
-            const completedTemplate = `{stlite_html_template}`.replace('STARTING_CODE', escapedCode).replace('STARTING_REQUIREMENTS', formattedRequirements.map(x => `"${{x}}"`).join(', ') || '');
-            
-            // Step 2: Create a Blob from the HTML content
-            const blob = new Blob([completedTemplate], {{ type: "text/html" }});
-            
-            // Step 3: Create a URL for the Blob
-            const url = URL.createObjectURL(blob);
-            
-            // Step 4: Create a download link
-            const downloadLink = document.createElement("a");
-            downloadLink.href = url;
-            downloadLink.download = "stlite-app.html"; // Specify the filename for the download
-            
-            // Step 5: Trigger a click event on the download link
-            downloadLink.click();
-            
-            // Clean up by revoking the URL
-            URL.revokeObjectURL(url);
-        }}"""
-    raise NotImplementedError(f'{demo_type} is not a supported demo type')
+def js_length(text: str) -> int:
+    # Offsets are compared with a textarea's value.length, which counts UTF-16 code units.
+    return len(text.encode('utf-16-le')) // 2
+
+
+def stream_delta(generation_id: int, offset: int, text: str) -> str:
+    # The id keeps a reply's first chunk distinct from the previous value, which would otherwise not fire a change.
+    return json.dumps({'id': generation_id, 'offset': offset, 'text': text})
+
+
+def append_delta_js(elem_id: str) -> str:
+    return f"""(delta) => {{
+        // Streamed replies arrive as chunks (see stream_delta) so only the new text crosses the websocket.
+        if (!delta) return [];
+        const {{id, offset, text}} = JSON.parse(delta);
+        const textarea = document.querySelector('#{elem_id} textarea');
+        if (!textarea) return [];
+        const current = textarea.dataset.generation === undefined ? -1 : Number(textarea.dataset.generation);
+        if (offset === 0 && id >= current) {{
+            textarea.value = text;
+            textarea.dataset.generation = id;
+        }} else if (id === current && offset === textarea.value.length) {{
+            textarea.value += text;
+        }}
+        // Any other offset belongs to a superseded reply or follows a missed chunk; the final update resyncs the text.
+        textarea.scrollTop = textarea.scrollHeight;
+        return [];
+    }}"""
@@ -0,0 +1,62 @@
+// Injected into the in-app stlite iframe so updates can wait for the actual rerun instead of a fixed delay.
+// Streamlit exposes its script run state on the app root; a rerun has finished once that state is seen leaving
+// 'running', and only then are the error elements in the app body the ones the new code produced.
+(function () {
+    const errorSelector = '.message, [data-testid="stException"]';
+    const stateAttribute = 'data-test-script-state';
+    const runningStates = ['running', 'rerunRequested'];
+
+    function scriptState() {
+        const app = document.querySelector('[' + stateAttribute + ']');
+        return app ? app.getAttribute(stateAttribute) : null;
+    }
+
+    // Elements left over from the previous run are kept, marked stale, until the new run replaces them.
+    function currentError() {
+        const errorElement = [...document.querySelectorAll(errorSelector)].find(x => !x.closest('[data-stale="true"]'));
+        return errorElement ? errorElement.innerHTML : null;
+    }
+
+    // Call before writing the entrypoint file; resolves with the error html of the rerun, or null if it succeeded.
+    window.waitForStliteRerun = function (timeoutMs) {
+        const staleErrors = new Set(document.querySelectorAll(errorSelector));
+        let started = false;
+        let stateChanged = false;
+        return new Promise(function (resolve) {
+            let observer = null;
+            let timer = null;
+            function finish(error) {
+                observer.disconnect();
+                clearTimeout(timer);
+                resolve(error);
+            }
+            function check(records) {
+                // Old values catch a run that started and finished between two observer callbacks.
+                for (const record of records) {
+                    if (record.attributeName === stateAttribute) {
+                        stateChanged = true;
+                        started = started || runningStates.includes(record.oldValue);
+                    }
+                }
+                const state = scriptState();
+                if (runningStates.includes(state)) {
+                    started = true;
+                } else if (started || (stateChanged && state === 'compilationError')) {
+                    observer.disconnect();
+                    clearTimeout(timer);
+                    // Let the frame that ends the run clear stale elements before reading errors.
+                    requestAnimationFrame(function () { finish(currentError()); });
+                }
+            }
+            observer = new MutationObserver(check);
+            observer.observe(document.body, {subtree: true, childList: true, attributes: true,
+                                             attributeFilter: [stateAttribute], attributeOldValue: true});
+            // Fallback in case the rerun never reports finishing; only errors that appeared since the write count.
+            timer = setTimeout(function () {
+                console.warn('stlite rerun did not finish within ' + timeoutMs + ' ms');
+                const newError = [...document.querySelectorAll(errorSelector)].find(x => !staleErrors.has(x));
+                finish(newError ? newError.innerHTML : null);
+            }, timeoutMs);
+        });
+    };
+})();
@@ -13,18 +13,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import argparse
+import asyncio
 import csv
 import json
+import threading
+import time
 from pathlib import Path
-from typing import Union
+from typing import NamedTuple, Optional, Union
 
 import numpy as np
-import torch
-from transformers import LlamaTokenizerFast
 
-import tensorrt_llm
-from tensorrt_llm.quantization import QuantMode
-from tensorrt_llm.runtime import ModelConfig, SamplingConfig
+from tracing import span
+
+# torch, transformers and tensorrt_llm are imported where they are used so tools that only need the helpers here
+# (prompt templates, engine limits, batching) start quickly and don't need a GPU stack installed.
 
 # from build import get_engine_name  # isort:skip
 
@@ -41,7 +43,27 @@ def throttle_generator(generator, stream_interval):
         yield out
 
 
+def coalesce_steps(generator, min_interval: float):
+    """Yields the first and last steps and, in between, the latest step once min_interval seconds have passed since
+    the previous yield, so downstream work per yield is bounded by wall-clock time rather than decode speed."""
+    last_yield = None
+    pending = None
+    for out in generator:
+        pending = out
+        now = time.monotonic()
+        if last_yield is None or now - last_yield >= min_interval:
+            last_yield = now
+            pending = None
+            yield out
+    if pending is not None:
+        yield pending
+
+
 def read_config(config_path: Path):
+    import tensorrt_llm
+    from tensorrt_llm.quantization import QuantMode
+    from tensorrt_llm.runtime import ModelConfig
+
     with open(config_path, 'r') as f:
         config = json.load(f)
     use_gpt_attention_plugin = config['plugin_config']['gpt_attention_plugin']
@@ -95,6 +117,76 @@ def read_config(config_path: Path):
     return model_config, tp_size, pp_size, dtype
 
 
+def read_engine_limits(config_path: Path) -> dict:
+    """Reads the shape limits an engine was built with from its config.json."""
+    with open(config_path, 'r') as f:
+        builder_config = json.load(f)['builder_config']
+    return {
+        'max_batch_size': builder_config.get('max_batch_size'),
+        'max_input_len': builder_config.get('max_input_len'),
+        'max_output_len': builder_config.get('max_output_len'),
+        'max_beam_width': builder_config.get('max_beam_width'),
+    }
+
+
+def engine_file_path(engine_dir: Path, dtype: str, tp_size: int, pp_size: int, runtime_rank: int) -> Path:
+    """Finds this rank's serialized engine, named the way TensorRT-LLM's build scripts name it."""
+    with open(engine_dir / 'config.json', 'r') as f:
+        model_name = json.load(f)['builder_config'].get('name', 'llama')
+    if pp_size == 1:
+        engine_name = f'{model_name}_{dtype}_tp{tp_size}_rank{runtime_rank}.engine'
+    else:
+        engine_name = f'{model_name}_{dtype}_tp{tp_size}_pp{pp_size}_rank{runtime_rank}.engine'
+    if (engine_dir / engine_name).exists():
+        return engine_dir / engine_name
+    # Engines built by other scripts may be named differently; accept a single engine for this rank.
+    candidates = sorted(engine_dir.glob(f'*rank{runtime_rank}.engine'))
+    if len(candidates) != 1:
+        raise FileNotFoundError(f'Expected {engine_name} or a single *rank{runtime_rank}.engine in {engine_dir}')
+    return candidates[0]
+
+
+class DecoderSetupCache:
+    """Skips decoder.setup, which reallocates the KV cache and work buffers, when a request fits the current ones.
+
+    Buffers are sized to the high-water mark of input lengths seen, rounded up to a bucket so lengths that creep up
+    slowly don't force a reallocation each time. Batch size, beams and output length must match exactly since the
+    session's buffers and decode loop are shaped by them.
+    """
+
+    def __init__(self, decoder, max_input_len: Union[int, None] = None, bucket_size: int = 256):
+        self.decoder = decoder
+        self.max_input_len = max_input_len
+        self.bucket_size = bucket_size
+        self.shape = None
+        self.setups = 0
+        self.reuses = 0
+
+    def bucket(self, length: int) -> int:
+        bucketed = -(-length // self.bucket_size) * self.bucket_size
+        if self.max_input_len is not None:
+            bucketed = min(bucketed, self.max_input_len)
+        return max(bucketed, length)
+
+    def setup(self, batch_size: int, max_input_length: int, max_output_len: int, num_beams: int) -> bool:
+        """Ensures the decoder buffers fit the request; returns True if the existing allocation was reused."""
+        if self.shape is not None:
+            cached_batch_size, cached_input_length, cached_output_len, cached_num_beams = self.shape
+            if (cached_batch_size, cached_output_len, cached_num_beams) == (batch_size, max_output_len, num_beams):
+                if max_input_length <= cached_input_length:
+                    self.reuses += 1
+                    return True
+                max_input_length = max(max_input_length, cached_input_length)
+        input_length = self.bucket(max_input_length)
+        self.decoder.setup(batch_size, input_length, max_output_len, num_beams)
+        self.shape = (batch_size, input_length, max_output_len, num_beams)
+        self.setups += 1
+        return False
+
+    def stats(self) -> dict:
+        return {'setups': self.setups, 'allocations_avoided': self.reuses, 'shape': self.shape}
+
+
 def parse_input(input_text: str, input_file: str, tokenizer, end_id: int,
                 remove_input_padding: bool, input_tokens_limit: Union[int,
         None]):
@@ -130,6 +222,12 @@ def parse_input(input_text: str, input_file: str, tokenizer, end_id: int,
             f" will be capped to {input_tokens_limit}")
         input_tokens = [x[-input_tokens_limit:] for x in input_tokens]
 
+    return input_tensors(input_tokens, end_id, remove_input_padding)
+
+
+def input_tensors(input_tokens, end_id: int, remove_input_padding: bool):
+    import torch
+
     input_ids = None
     input_lengths = torch.tensor([len(x) for x in input_tokens],
                                  dtype=torch.int32,
@@ -146,21 +244,50 @@ def parse_input(input_text: str, input_file: str, tokenizer, end_id: int,
     return input_ids, input_lengths
 
 
-def ptuning_setup(prompt_table, dtype, hidden_size, tasks, input_ids,
-                  input_lengths, remove_input_padding):
-    if prompt_table is not None:
-        prompt_table = torch.from_numpy(np.load(prompt_table))
-        task_vocab_size = torch.tensor([prompt_table.shape[1]],
+class PromptTableRegistry:
+    """Prompt tuning tables loaded once and kept on the device, addressable by name.
+
+    Each .npy table has shape [num_tasks, task_vocab_size, hidden_size]; per-request task ids select rows within the
+    named table so e.g. each demo type can have its own soft prompts without a host-to-device copy per request.
+    """
+
+    default_name = 'default'
+
+    def __init__(self, dtype, hidden_size):
+        import torch
+
+        self.dtype = dtype
+        self.tables = {}
+        # Placeholder passed to the engine when no table applies, matching the previous per-request behaviour.
+        self.empty = (torch.empty([1, hidden_size]).cuda(), torch.zeros([1]).cuda())
+
+    def register(self, name: str, path: Path):
+        import torch
+        import tensorrt_llm
+
+        # Memory-map so only the table itself is read from disk, then copy it to the device a single time.
+        table = np.load(path, mmap_mode='r')
+        task_vocab_size = torch.tensor([table.shape[1]],
                                        dtype=torch.int32,
                                        device="cuda")
-        prompt_table = prompt_table.view(
-            (prompt_table.shape[0] * prompt_table.shape[1],
-             prompt_table.shape[2]))
-        prompt_table = prompt_table.cuda().to(
-            dtype=tensorrt_llm._utils.str_dtype_to_torch(dtype))
-    else:
-        prompt_table = torch.empty([1, hidden_size]).cuda()
-        task_vocab_size = torch.zeros([1]).cuda()
+        table = np.array(table.reshape((table.shape[0] * table.shape[1], table.shape[2])))
+        table = torch.from_numpy(table).cuda().to(dtype=tensorrt_llm._utils.str_dtype_to_torch(self.dtype))
+        self.tables[name] = (table, task_vocab_size)
+
+    def register_dir(self, directory: Path):
+        for path in sorted(Path(directory).glob('*.npy')):
+            self.register(path.stem, path)
+
+    def get(self, name: Union[str, None]):
+        """Returns the named table, falling back to the default table and then to the empty placeholder."""
+        if name in self.tables:
+            return self.tables[name]
+        return self.tables.get(self.default_name, self.empty)
+
+
+def ptuning_setup(prompt_table, task_vocab_size, tasks, input_ids,
+                  input_lengths, remove_input_padding):
+    import torch
 
     num_sequences = input_lengths.size(
         0) if remove_input_padding else input_ids.size(0)
@@ -222,6 +349,11 @@ def parse_arguments():
               If it is set to None, we will use the max sequence length.')
     parser.add_argument('--log_level', type=str, default='error')
     parser.add_argument('--engine_dir', type=str, default='llama_outputs')
+    parser.add_argument(
+        '--engine_dirs',
+        type=str,
+        default=None,
+        help="Comma-separated engine dirs to route requests across by size; overrides --engine_dir")
     parser.add_argument('--tokenizer_dir',
                         type=str,
                         default=".",
@@ -258,13 +390,36 @@ def parse_arguments():
                         type=int,
                         help="How often to return tokens when streaming.",
                         default=5)
+    parser.add_argument('--streaming_min_interval',
+                        type=float,
+                        help="Minimum seconds between streamed replies; 0 streams every streaming_interval tokens.",
+                        default=0.05)
     parser.add_argument(
         '--prompt_table',
         type=Path,
         help="Path to .npy file, exported by nemo_prompt_convert.py")
+    parser.add_argument(
+        '--prompt_table_dir',
+        type=Path,
+        help="Directory of .npy prompt tables, each registered under its file name")
     parser.add_argument(
         '--tasks',
         help="Comma-separated list of tasks for prompt tuning: ex 0,3,1,0")
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=0,
+        help="Run the generator in this many worker processes instead of in-process (0 disables)")
+    parser.add_argument(
+        '--worker_devices',
+        type=str,
+        default=None,
+        help="Comma-separated GPU ids, one worker per id; defaults to GPUs 0 to workers - 1")
+    parser.add_argument(
+        '--stub_workers',
+        default=False,
+        action='store_true',
+        help="Workers echo the prompt instead of loading an engine, e.g. to test the worker setup without a GPU")
     return parser.parse_args()
 
 
@@ -273,11 +428,78 @@ def template_input(user_input):
     return template
 
 
-class TensorRTLLMGenerator:
+def encode_prompt(tokenizer, input_text: str, input_tokens_limit: Union[int, None] = None) -> [int]:
+    input_tokens = tokenizer.encode(template_input(input_text), add_special_tokens=False)
+    if input_tokens_limit is not None:
+        input_tokens = input_tokens[-input_tokens_limit:]
+    return input_tokens
+
+
+class ReplyChunk(NamedTuple):
+    # Text appended to the reply; the complete decoded reply is only set on the last chunk.
+    delta: str
+    reply: Optional[str] = None
+
+
+def stable_text(text: str) -> str:
+    # Byte-fallback tokens of a partially generated multi-byte character decode to U+FFFD until the rest arrives.
+    return text.rstrip('\ufffd')
+
+
+class StreamingGenerator:
+    """Async streaming on top of a blocking stream() method, shared by the in-process and worker pool generators."""
+
+    def stream(self, input_text, cancel_event: threading.Event = None, prompt_table_name=None, tasks=None):
+        raise NotImplementedError
+
+    async def agenerate(self, input_text, cancel_event: threading.Event = None, prompt_table_name=None, tasks=None):
+        """Async generator of ReplyChunks; decoding runs in a worker thread and stops when cancelled or closed.
+
+        Deltas only ever extend the reply, so text that a later step may still rewrite is held back; the last chunk
+        carries the final decode, which is what callers should keep.
+        """
+        cancel_event = cancel_event or threading.Event()
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+
+        def run():
+            try:
+                for text in self.stream(input_text, cancel_event, prompt_table_name, tasks):
+                    loop.call_soon_threadsafe(queue.put_nowait, text)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        worker = asyncio.ensure_future(asyncio.to_thread(run))
+        previous = ''
+        text = ''
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    # Raises the decode thread's exception, if any.
+                    await worker
+                    break
+                text = item
+                stable = stable_text(text)
+                # Decoding rewrote text that was already sent; the final reply supersedes the deltas.
+                if len(stable) > len(previous) and stable.startswith(previous):
+                    yield ReplyChunk(stable[len(previous):])
+                    previous = stable
+            yield ReplyChunk(text[len(previous):] if text.startswith(previous) else '', text)
+        finally:
+            # Runs on completion, on error and when the consumer is cancelled (e.g. by a Gradio cancel event).
+            cancel_event.set()
+            # The thread stops after its current step; waiting for it frees the engine before the caller moves on and
+            # surfaces an error that arrived after the consumer stopped reading.
+            await asyncio.shield(worker)
+
+
+class TensorRTLLMGenerator(StreamingGenerator):
 
     def __init__(self, input_file, tokenizer, model_config, input_tokens_limit, decoder, max_output_len,
-                 num_beams, prompt_table, dtype, tasks, sampling_config, streaming, streaming_interval, runtime_rank,
-                 output_csv, output_npy, runtime_mapping):
+                 num_beams, prompt_tables, dtype, tasks, sampling_config, streaming, streaming_interval, runtime_rank,
+                 output_csv, output_npy, runtime_mapping, max_input_len=None, streaming_min_interval=0.05):
         self.input_file = input_file
         self.tokenizer = tokenizer
         self.model_config = model_config
@@ -285,29 +507,54 @@ class TensorRTLLMGenerator:
         self.decoder = decoder
         self.max_output_len = max_output_len
         self.num_beams = num_beams
-        self.prompt_table = prompt_table
+        self.prompt_tables = prompt_tables
         self.dtype = dtype
         self.tasks = tasks
         self.sampling_config = sampling_config
         self.streaming = streaming
         self.streaming_interval = streaming_interval
+        self.streaming_min_interval = streaming_min_interval
         self.runtime_rank = runtime_rank
         self.output_csv = output_csv
         self.output_npy = output_npy
         self.runtime_mapping = runtime_mapping
-
-    def generate(self, input_text):
+        # The generation session holds a single set of buffers so only one request may decode at a time.
+        self.lock = threading.Lock()
+        self.decoder_setup = DecoderSetupCache(decoder, max_input_len)
+
+    def setup_inputs(self, input_text, prompt_table_name=None, tasks=None):
+        with span('parse_input'):
+            input_ids, input_lengths = parse_input(
+                template_input(input_text),
+                self.input_file,
+                self.tokenizer,
+                EOS_TOKEN,
+                self.model_config.remove_input_padding,
+                input_tokens_limit=self.input_tokens_limit)
+        return input_ids, input_lengths, self.setup_decoder(input_ids, input_lengths, prompt_table_name, tasks)
+
+    def setup_decoder(self, input_ids, input_lengths, prompt_table_name=None, tasks=None):
+        max_input_length = input_lengths.max().item()
+        with span('decoder.setup', max_input_length=max_input_length) as setup_span:
+            reused = self.decoder_setup.setup(input_lengths.size(0),
+                                              max_input_length,
+                                              self.max_output_len,
+                                              self.num_beams)
+            # max_kv_cache_length=max_kv_cache_len)
+            setup_span.update(reused=reused, **self.decoder_setup.stats())
+
+        with span('ptuning_setup'):
+            ptuning_args = [] if self.model_config.max_prompt_embedding_table_size == 0 else ptuning_setup(
+                *self.prompt_tables.get(prompt_table_name), tasks or self.tasks, input_ids,
+                input_lengths, self.model_config.remove_input_padding)
+        return ptuning_args
+
+    def generate(self, input_text, prompt_table_name=None, tasks=None):
         # input_text = self.input_text
-        input_file = self.input_file
         tokenizer = self.tokenizer
         model_config = self.model_config
-        input_tokens_limit = self.input_tokens_limit
         decoder = self.decoder
         max_output_len = self.max_output_len
-        num_beams = self.num_beams
-        prompt_table = self.prompt_table
-        dtype = self.dtype
-        tasks = self.tasks
         sampling_config = self.sampling_config
         streaming = self.streaming
         streaming_interval = self.streaming_interval
@@ -316,57 +563,108 @@ class TensorRTLLMGenerator:
         output_npy = self.output_npy
         runtime_mapping = self.runtime_mapping
 
-        input_ids, input_lengths = parse_input(
-            template_input(input_text),
-            input_file,
-            tokenizer,
-            EOS_TOKEN,
-            model_config.remove_input_padding,
-            input_tokens_limit=input_tokens_limit)
-
-        max_input_length = torch.max(input_lengths).item()
-        decoder.setup(input_lengths.size(0),
-                      max_input_length,
-                      max_output_len,
-                      num_beams)
-        # max_kv_cache_length=max_kv_cache_len)
-
-        ptuning_args = [] if model_config.max_prompt_embedding_table_size == 0 else ptuning_setup(
-            prompt_table, dtype, model_config.hidden_size, tasks, input_ids,
-            input_lengths, model_config.remove_input_padding)
-
-        outputs = decoder.decode(input_ids,
-                                 input_lengths,
-                                 sampling_config,
-                                 *ptuning_args,
-                                 streaming=streaming,
-                                 output_sequence_lengths=True,
-                                 return_dict=True)
-        torch.cuda.synchronize()
-        if streaming:
-            for outputs_dict in throttle_generator(outputs, streaming_interval):
+        with self.lock:
+            input_ids, input_lengths, ptuning_args = self.setup_inputs(input_text, prompt_table_name, tasks)
+
+            with span('decoder.decode'):
+                outputs = decoder.decode(input_ids,
+                                         input_lengths,
+                                         sampling_config,
+                                         *ptuning_args,
+                                         streaming=streaming,
+                                         output_sequence_lengths=True,
+                                         return_dict=True)
+            with span('torch.cuda.synchronize'):
+                import torch
+                torch.cuda.synchronize()
+            if streaming:
+                for outputs_dict in throttle_generator(outputs, streaming_interval):
+                    if runtime_rank == 0:
+                        output_ids = outputs_dict['output_ids']
+                        sequence_lengths = outputs_dict['sequence_lengths']
+                        with span('print_output'):
+                            return print_output(output_ids, input_lengths, max_output_len,
+                                                tokenizer, output_csv, output_npy,
+                                                sequence_lengths)
+            else:
                 if runtime_rank == 0:
-                    output_ids = outputs_dict['output_ids']
-                    sequence_lengths = outputs_dict['sequence_lengths']
-                    return print_output(output_ids, input_lengths, max_output_len,
-                                       tokenizer, output_csv, output_npy,
-                                       sequence_lengths)
-        else:
-            if runtime_rank == 0:
-                output_ids = outputs['output_ids']
-                sequence_lengths = outputs['sequence_lengths']
-                return print_output(output_ids, input_lengths, max_output_len, tokenizer,
-                                    output_csv, output_npy, sequence_lengths)
-
-            if model_config.gather_all_token_logits:
-                if runtime_mapping.is_last_pp_rank():
-                    print(
-                        f"context_logits.shape: {outputs['context_logits'].shape}")
-                    print(
-                        f"generation_logits.shape: {len(outputs['generation_logits']), outputs['generation_logits'][0].shape}"
-                    )
-                    print(outputs['context_logits'])
-                    print(outputs['generation_logits'])
+                    output_ids = outputs['output_ids']
+                    sequence_lengths = outputs['sequence_lengths']
+                    with span('print_output'):
+                        return print_output(output_ids, input_lengths, max_output_len, tokenizer,
+                                            output_csv, output_npy, sequence_lengths)
+
+                if model_config.gather_all_token_logits:
+                    if runtime_mapping.is_last_pp_rank():
+                        print(
+                            f"context_logits.shape: {outputs['context_logits'].shape}")
+                        print(
+                            f"generation_logits.shape: {len(outputs['generation_logits']), outputs['generation_logits'][0].shape}"
+                        )
+                        print(outputs['context_logits'])
+                        print(outputs['generation_logits'])
+
+    def request_key(self, input_text, prompt_table_name=None, tasks=None) -> tuple:
+        """Identifies requests that would produce the same output so concurrent duplicates can share one decode."""
+        return input_text, self.max_output_len, self.num_beams, repr(self.sampling_config), \
+            prompt_table_name, tasks or self.tasks
+
+    def generate_batch(self, batch_input_tokens: [np.ndarray], prompt_table_name=None, tasks=None) -> [np.ndarray]:
+        """Decodes several tokenized prompts in one batch, returning each one's generated token ids (first beam)."""
+        with self.lock:
+            input_ids, input_lengths = input_tensors(batch_input_tokens, EOS_TOKEN,
+                                                     self.model_config.remove_input_padding)
+            ptuning_args = self.setup_decoder(input_ids, input_lengths, prompt_table_name, tasks)
+            with span('decoder.decode', batch_size=len(batch_input_tokens)):
+                outputs = self.decoder.decode(input_ids,
+                                              input_lengths,
+                                              self.sampling_config,
+                                              *ptuning_args,
+                                              output_sequence_lengths=True,
+                                              return_dict=True)
+                output_ids = outputs['output_ids'].cpu().numpy()
+                sequence_lengths = outputs['sequence_lengths'].cpu().numpy()
+        return [output_ids[b, 0, len(input_tokens):sequence_lengths[b, 0]]
+                for b, input_tokens in enumerate(batch_input_tokens)]
+
+    def stream_tokens(self, input_tokens: [int], cancel_event: threading.Event = None, prompt_table_name=None,
+                      tasks=None):
+        """Yields the generated token ids so far at most every streaming_min_interval seconds (or every
+        streaming_interval steps when that is 0); stops between yields once cancelled."""
+        with self.lock:
+            input_ids, input_lengths = input_tensors([input_tokens], EOS_TOKEN, self.model_config.remove_input_padding)
+            ptuning_args = self.setup_decoder(input_ids, input_lengths, prompt_table_name, tasks)
+            outputs = self.decoder.decode(input_ids,
+                                          input_lengths,
+                                          self.sampling_config,
+                                          *ptuning_args,
+                                          streaming=True,
+                                          output_sequence_lengths=True,
+                                          return_dict=True)
+            input_length = len(input_tokens)
+            if self.streaming_min_interval > 0:
+                steps = coalesce_steps(outputs, self.streaming_min_interval)
+            else:
+                steps = throttle_generator(outputs, self.streaming_interval)
+            try:
+                with span('decoder.decode', streaming=True):
+                    for outputs_dict in steps:
+                        if cancel_event is not None and cancel_event.is_set():
+                            break
+                        output_end = outputs_dict['sequence_lengths'][0][0].item()
+                        yield outputs_dict['output_ids'][0][0][input_length:output_end].cpu().numpy()
+            finally:
+                # Closing the decode generator ends the decode loop so the engine is free for the next request.
+                outputs.close()
+
+    def stream(self, input_text, cancel_event: threading.Event = None, prompt_table_name=None, tasks=None):
+        """Yields the decoded reply so far as stream_tokens does; stops between yields once cancelled."""
+        with span('parse_input'):
+            input_tokens = encode_prompt(self.tokenizer, input_text, self.input_tokens_limit)
+        for output_tokens in self.stream_tokens(input_tokens, cancel_event, prompt_table_name, tasks):
+            with span('detokenize'):
+                text = self.tokenizer.decode(output_tokens.tolist())
+            yield text
 
 
 def build_generator(
@@ -382,10 +680,31 @@ def build_generator(
         num_beams: int = 1,
         streaming: bool = False,
         streaming_interval: int = 5,
+        streaming_min_interval: float = 0.05,
         prompt_table: Path = None,
+        prompt_table_dir: Path = None,
         tasks: str = None,
         input_tokens_limit: Union[None, int] = None,
+        workers: int = 0,
+        worker_devices: str = None,
+        stub_workers: bool = False,
+        engine_dirs: str = None,
 ):
+    # Kept on the generator so an equivalent one can be rebuilt, e.g. for a different engine_dir.
+    build_kwargs = dict(locals())
+    if engine_dirs:
+        from engine_router import EngineRouter
+        return EngineRouter(build_kwargs)
+
+    if workers > 0 or worker_devices:
+        from generator_workers import GeneratorWorkerPool
+        return GeneratorWorkerPool(build_kwargs)
+
+    import torch
+    from transformers import LlamaTokenizerFast
+    import tensorrt_llm
+    from tensorrt_llm.runtime import SamplingConfig
+
     tensorrt_llm.logger.set_level(log_level)
 
     engine_dir = Path(engine_dir)
@@ -406,10 +725,7 @@ def build_generator(
                                      pad_id=PAD_TOKEN,
                                      num_beams=num_beams)
 
-    # engine_name = get_engine_name('llama', dtype, tp_size, pp_size,
-    #                               runtime_rank)
-    engine_name = "llama_float16_tp1_rank0.engine"
-    serialize_path = engine_dir / engine_name
+    serialize_path = engine_file_path(engine_dir, dtype, tp_size, pp_size, runtime_rank)
     with open(serialize_path, 'rb') as f:
         engine_buffer = f.read()
     decoder = tensorrt_llm.runtime.GenerationSession(model_config,
@@ -420,9 +736,20 @@ def build_generator(
     if runtime_rank == 0:
         print(f"Running the {dtype} engine ...")
 
+    prompt_tables = None
+    if model_config.max_prompt_embedding_table_size > 0:
+        prompt_tables = PromptTableRegistry(dtype, model_config.hidden_size)
+        if prompt_table is not None:
+            prompt_tables.register(PromptTableRegistry.default_name, prompt_table)
+        if prompt_table_dir is not None:
+            prompt_tables.register_dir(prompt_table_dir)
+
     generator = TensorRTLLMGenerator(input_file, tokenizer, model_config, input_tokens_limit, decoder, max_output_len,
-                                     num_beams, prompt_table, dtype, tasks, sampling_config, streaming,
-                                     streaming_interval, runtime_rank, output_csv, output_npy, runtime_mapping)
+                                     num_beams, prompt_tables, dtype, tasks, sampling_config, streaming,
+                                     streaming_interval, runtime_rank, output_csv, output_npy, runtime_mapping,
+                                     max_input_len=read_engine_limits(config_path)['max_input_len'],
+                                     streaming_min_interval=streaming_min_interval)
+    generator.build_kwargs = build_kwargs
     return generator
 
 
@@ -0,0 +1,122 @@
+import collections
+import contextlib
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+# Spans are kept in a bounded in-memory ring buffer and exported on demand; profiling is opt-in per request.
+trace_buffer_size = int(os.getenv('KITEWIND_TRACE_BUFFER_SIZE', '20000'))
+profile_sample_rate = float(os.getenv('KITEWIND_PROFILE_SAMPLE_RATE', '0'))
+profile_interval = float(os.getenv('KITEWIND_PROFILE_INTERVAL', '0.005'))
+profile_dir = Path(os.getenv('KITEWIND_PROFILE_DIR', 'profiles'))
+trace_route_path = '/kitewind/trace'
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+trace_events = collections.deque(maxlen=trace_buffer_size)
+
+
+def now_us() -> float:
+    return time.perf_counter_ns() / 1000
+
+
+@contextlib.contextmanager
+def span(name: str, **args):
+    """Records a Chrome trace complete event for the enclosed block, tagged with the current request id."""
+    start = now_us()
+    args = {'request_id': request_id_var.get(), **args}
+    try:
+        # The args dict is yielded so the block can attach results, e.g. whether a buffer was reused.
+        yield args
+    finally:
+        trace_events.append({
+            'name': name,
+            'ph': 'X',
+            'ts': start,
+            'dur': now_us() - start,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args,
+        })
+
+
+class StackSampler:
+    """Samples every thread's Python stack on an interval and writes collapsed stacks for flamegraph tools."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.counts = collections.Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})')
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def stop(self, path: Path):
+        self.stopped.set()
+        self.thread.join()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            for stack, count in self.counts.items():
+                f.write(f'{stack} {count}\n')
+
+
+@contextlib.contextmanager
+def request_trace(name: str, **args):
+    """Assigns a request id for the enclosed spans and, for a sampled fraction of requests, profiles it."""
+    request_id = uuid.uuid4().hex[:12]
+    previous_request_id = request_id_var.get()
+    request_id_var.set(request_id)
+    sampler = None
+    if profile_sample_rate and random.random() < profile_sample_rate:
+        sampler = StackSampler(profile_interval)
+        sampler.start()
+    try:
+        with span(name, **args):
+            yield request_id
+    finally:
+        # Set rather than reset with a token since async generators may resume in a different context.
+        request_id_var.set(previous_request_id)
+        if sampler is not None:
+            sampler.stop(profile_dir / f'{name}-{request_id}.folded')
+
+
+def chrome_trace(request_id: str = None) -> dict:
+    events = [e for e in list(trace_events) if request_id is None or e['args'].get('request_id') == request_id]
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def write_chrome_trace(path: Path, request_id: str = None):
+    with open(path, 'w') as f:
+        json.dump(chrome_trace(request_id), f)
+
+
+def mount_trace_route(app):
+    """Serves the buffered spans as Chrome trace JSON, loadable in chrome://tracing or ui.perfetto.dev."""
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse
+
+    async def trace_endpoint(request: Request) -> JSONResponse:
+        return JSONResponse(chrome_trace(request.query_params.get('request_id')))
+
+    app.add_route(trace_route_path, trace_endpoint, methods=['GET'])
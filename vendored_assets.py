@@ -0,0 +1,105 @@
+import argparse
+import io
+import shutil
+import typing
+from pathlib import Path
+
+vendor_dir = Path('vendor')
+vendor_url_path = '/vendor'
+
+# Runtime packages the app iframes load from jsdelivr; the version is part of the local URL so files are immutable.
+# The templates request these exact versions, so the vendored copy serves the same files the CDN would.
+vendored_packages = {
+    '@gradio/lite': {
+        'version': '4.11.0',
+        'dist_dir': 'dist',
+    },
+    '@stlite/mountable': {
+        'version': '0.42.3',
+        'dist_dir': 'build',
+    },
+}
+
+
+def cdn_prefix(name: str) -> str:
+    package = vendored_packages[name]
+    return f"https://cdn.jsdelivr.net/npm/{name}@{package['version']}/{package['dist_dir']}/"
+
+
+def package_dir(name: str) -> Path:
+    return vendor_dir / f"{name}@{vendored_packages[name]['version']}"
+
+
+def is_vendored(name: str) -> bool:
+    return (package_dir(name) / vendored_packages[name]['dist_dir']).is_dir()
+
+
+def local_url(name: str) -> str:
+    package = vendored_packages[name]
+    return f"{vendor_url_path}/{name}@{package['version']}/{package['dist_dir']}/"
+
+
+def localize_asset_urls(template: str) -> str:
+    """Points CDN asset URLs in a template at the local copies for any package that has been vendored."""
+    for name in vendored_packages:
+        if not is_vendored(name):
+            continue
+        template = template.replace(cdn_prefix(name), local_url(name))
+    return template
+
+
+def local_asset_path(url: str) -> typing.Optional[Path]:
+    """Returns the vendored file for a CDN asset URL if that package has been vendored."""
+    for name in vendored_packages:
+        prefix = cdn_prefix(name)
+        if url.startswith(prefix) and is_vendored(name):
+            path = package_dir(name) / vendored_packages[name]['dist_dir'] / url[len(prefix):]
+            return path if path.is_file() else None
+    return None
+
+
+def download_package(name: str, force: bool = False):
+    import tarfile
+    import urllib.request
+
+    package = vendored_packages[name]
+    target = package_dir(name)
+    if is_vendored(name) and not force:
+        print(f"{name}@{package['version']} already vendored in {target}")
+        return
+    tarball_url = f"https://registry.npmjs.org/{name}/-/{name.split('/')[-1]}-{package['version']}.tgz"
+    print(f"Downloading {tarball_url}")
+    with urllib.request.urlopen(tarball_url) as response:
+        data = response.read()
+    shutil.rmtree(target, ignore_errors=True)
+    target.mkdir(parents=True)
+    prefix = f"package/{package['dist_dir']}/"
+    with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as archive:
+        members = [m for m in archive.getmembers() if m.name.startswith(prefix) and (m.isfile() or m.isdir())]
+        for member in members:
+            member.name = member.name[len('package/'):]
+        archive.extractall(target, members=members)
+    print(f"Vendored {name}@{package['version']} into {target}")
+
+
+def mount_vendored_assets(app):
+    """Serves the vendor directory from the Gradio FastAPI app with long-lived immutable cache headers."""
+    if not vendor_dir.is_dir():
+        return
+    from starlette.staticfiles import StaticFiles
+
+    class ImmutableStaticFiles(StaticFiles):
+        def file_response(self, *args, **kwargs):
+            response = super().file_response(*args, **kwargs)
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+            return response
+
+    app.mount(vendor_url_path, ImmutableStaticFiles(directory=vendor_dir), name='vendor')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Vendor gradio-lite and stlite runtime assets for offline use.')
+    parser.add_argument('--force', action='store_true', help='Re-download packages that are already vendored.')
+    args = parser.parse_args()
+    for package_name in vendored_packages:
+        download_package(package_name, force=args.force)